@@ -4,6 +4,9 @@ from .models import (
     Course,
     Message,
     Review,
+    Conversation,
+    ReviewStats,
+    Job,
    
     
 )
@@ -13,6 +16,9 @@ admin.site.register(Profile)
 admin.site.register(Course)
 admin.site.register(Message)
 admin.site.register(Review)
+admin.site.register(Conversation)
+admin.site.register(ReviewStats)
+admin.site.register(Job)
 
 
 
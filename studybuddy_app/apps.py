@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class StudybuddyAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "studybuddy_app"
+
+    def ready(self):
+        from . import query_budget, signals  # noqa: F401
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Course
+
+
+CATALOG_KEY = 'catalog:courses'
+
+# Seconds the catalog is kept; Course save/delete drops it immediately anyway
+CATALOG_TTL = getattr(settings, 'COURSE_CATALOG_TTL', 3600)
+
+
+def _load():
+    return list(Course.objects.only('id', 'code', 'name').order_by('code'))
+
+
+def courses():
+    """Every Course in code order, from the cache (one query after a miss)"""
+    return cache.get_or_set(CATALOG_KEY, _load, CATALOG_TTL)
+
+
+def invalidate():
+    cache.delete(CATALOG_KEY)
@@ -0,0 +1,58 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.contrib.auth.models import User
+
+from .messaging import mark_read, save_message, thread_group
+from .models import Message
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """Live chat thread between the connected user and ws/chat/<user_id>/.
+
+    Messages are saved through messaging.save_message, which broadcasts the
+    committed row to the thread's group; this consumer relays those frames.
+    Messages relayed to the receiver count as read, and the partner's read
+    pointer is relayed so the sender can show them as seen.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        partner_id = self.scope['url_route']['kwargs']['user_id']
+        if not self.user.is_authenticated or partner_id == self.user.id:
+            await self.close()
+            return
+        self.partner = await database_sync_to_async(User.objects.filter(id=partner_id).first)()
+        if self.partner is None:
+            await self.close()
+            return
+
+        self.group_name = thread_group(self.user.id, self.partner.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        text = str(content.get('content', '')).strip()
+        if not text:
+            await self.send_json({'error': "Message cannot be empty.", 'client_id': content.get('client_id')})
+            return
+        await database_sync_to_async(save_message)(
+            Message(sender=self.user, receiver=self.partner, content=text),
+            client_id=content.get('client_id'),
+        )
+
+    async def chat_message(self, event):
+        message = event['message']
+        await self.send_json({
+            'message': {**message, 'sent': message['sender_id'] == self.user.id},
+            'client_id': event['client_id'] if message['sender_id'] == self.user.id else None,
+        })
+        if message['sender_id'] == self.partner.id:
+            await database_sync_to_async(mark_read)(self.user, self.partner, up_to=message['id'])
+
+    async def chat_read(self, event):
+        if event['reader_id'] == self.partner.id:
+            await self.send_json({'read': event['last_read']})
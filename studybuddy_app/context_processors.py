@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from .messaging import total_unread
+
+
+def unread_messages(request):
+    """unread_count on every page; looked up only if a template uses it"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'unread_count': 0}
+    return {'unread_count': SimpleLazyObject(lambda: total_unread(user.id))}
@@ -0,0 +1,188 @@
+import re
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+from . import catalog
+from .models import Profile, ProfileCourse
+from .process_index import ProcessIndex
+
+
+_CODE_SPLIT = re.compile(r'[\s,;]+')
+
+
+class CourseBitmaps:
+    """One bitmap of profile rows per course, packed eight rows to a byte.
+
+    Row r of a bitmap is bit (0x80 >> r % 8) of byte r // 8, the order
+    np.packbits uses, so AND/OR/NOT over whole rosters are single NumPy
+    operations over a few kilobytes each.
+    """
+
+    def __init__(self, capacity=64):
+        self.rows = {}
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.alive = np.zeros(capacity // 8, dtype=np.uint8)
+        self.bitmaps = {}
+        self.row_courses = []
+
+    @classmethod
+    def build(cls):
+        profile_ids = list(Profile.objects.values_list('id', flat=True).order_by('id'))
+        index = cls(capacity=max(64, -(-len(profile_ids) // 8) * 8))
+        n = len(profile_ids)
+        index.size = n
+        index.ids[:n] = profile_ids
+        index.rows = {profile_id: row for row, profile_id in enumerate(profile_ids)}
+        index.row_courses = [set() for _ in range(n)]
+        index.alive = np.packbits(np.arange(len(index.ids)) < n)
+
+        rosters = {}
+        for profile_id, course_id in ProfileCourse.objects.values_list('profile_id', 'course_id'):
+            row = index.rows.get(profile_id)
+            if row is not None:
+                index.row_courses[row].add(course_id)
+                rosters.setdefault(course_id, []).append(row)
+        for course_id, rows in rosters.items():
+            bits = np.zeros(len(index.ids), dtype=bool)
+            bits[rows] = True
+            index.bitmaps[course_id] = np.packbits(bits)
+        return index
+
+    def _grow(self):
+        extra = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.zeros(extra, dtype=np.int64)])
+        pad = np.zeros(extra // 8, dtype=np.uint8)
+        self.alive = np.concatenate([self.alive, pad])
+        self.bitmaps = {course_id: np.concatenate([bitmap, pad]) for course_id, bitmap in self.bitmaps.items()}
+
+    def _bitmap(self, course_id):
+        bitmap = self.bitmaps.get(course_id)
+        if bitmap is None:
+            bitmap = self.bitmaps[course_id] = np.zeros(len(self.alive), dtype=np.uint8)
+        return bitmap
+
+    @staticmethod
+    def _set(bitmap, row, on):
+        mask = np.uint8(0x80 >> (row & 7))
+        if on:
+            bitmap[row >> 3] |= mask
+        else:
+            bitmap[row >> 3] &= ~mask
+
+    def _row(self, profile_id):
+        row = self.rows.get(profile_id)
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.rows[profile_id] = row
+            self.ids[row] = profile_id
+            self.row_courses.append(set())
+        return row
+
+    def set_courses(self, profile_id, course_ids):
+        """Replace a profile's memberships; course_ids=None drops the profile"""
+        row = self._row(profile_id)
+        new = set(course_ids or ())
+        old = self.row_courses[row]
+        for course_id in old - new:
+            self._set(self._bitmap(course_id), row, False)
+        for course_id in new - old:
+            self._set(self._bitmap(course_id), row, True)
+        self.row_courses[row] = new
+        self._set(self.alive, row, course_ids is not None)
+
+    def put_profile(self, profile_id):
+        """Add a profile with no courses yet; an existing one keeps its courses"""
+        self._set(self.alive, self._row(profile_id), True)
+
+    def drop_profile(self, profile_id):
+        if profile_id in self.rows:
+            self.set_courses(profile_id, None)
+
+    def change_courses(self, profile_id, added=(), removed=()):
+        """Add and remove course memberships of one profile (removed=None: all of them)"""
+        row = self.rows.get(profile_id)
+        current = self.row_courses[row] if row is not None else set()
+        kept = set() if removed is None else current - set(removed)
+        self.set_courses(profile_id, kept | set(added))
+
+    def match(self, all_of=(), any_of=(), none_of=()):
+        """Ids of profiles taking every course in all_of, at least one of any_of
+        (when given) and none of none_of, in id order"""
+        empty = np.zeros(len(self.alive), dtype=np.uint8)
+        result = self.alive.copy()
+        for course_id in all_of:
+            result &= self.bitmaps.get(course_id, empty)
+        if any_of:
+            union = empty.copy()
+            for course_id in any_of:
+                union |= self.bitmaps.get(course_id, empty)
+            result &= union
+        for course_id in none_of:
+            result &= ~self.bitmaps.get(course_id, empty)
+        rows = np.flatnonzero(np.unpackbits(result)[:self.size])
+        return self.ids[rows]
+
+
+# Stands in for a course code that names no course: its bitmap is always empty
+UNKNOWN_COURSE = -1
+
+
+@dataclass
+class CourseFilter:
+    """Course ids a profile must take all of, any of, or none of"""
+    all_of: tuple = ()
+    any_of: tuple = ()
+    none_of: tuple = ()
+
+    def __bool__(self):
+        return bool(self.all_of or self.any_of or self.none_of)
+
+    @classmethod
+    def from_query(cls, params):
+        """Read ?all=, ?any= and ?none= (course codes, comma separated or repeated).
+
+        A code that names no course can't be taken, so in all= it matches
+        nobody, in any= it adds nobody and in none= it excludes nobody.
+        """
+        ids_by_code = {course.code.lower(): course.id for course in catalog.courses()}
+        found = {}
+        for name in ('all', 'any', 'none'):
+            codes = [
+                code
+                for value in params.getlist(name)
+                for code in _CODE_SPLIT.split(value.strip().lower())
+                if code
+            ]
+            found[name] = tuple(dict.fromkeys(ids_by_code.get(code, UNKNOWN_COURSE) for code in codes))
+        return cls(found['all'], found['any'], found['none'])
+
+    def profile_ids(self):
+        """Set of matching profile ids"""
+        return _index.read(lambda index: set(index.match(self.all_of, self.any_of, self.none_of).tolist()))
+
+
+_index = ProcessIndex(CourseBitmaps.build, ttl=getattr(settings, 'COURSE_BITMAP_TTL', 300))
+invalidate = _index.invalidate
+
+
+def profile_saved(profile):
+    _index.apply(lambda index: index.put_profile(profile.id))
+
+
+def profile_deleted(profile_id):
+    _index.apply(lambda index: index.drop_profile(profile_id))
+
+
+def courses_changed(changes):
+    """Apply {profile_id: (added course ids, removed course ids or None for all)}
+    to an already built index (no-op otherwise)"""
+    def change(index):
+        for profile_id, (added, removed) in changes.items():
+            index.change_courses(profile_id, added, removed)
+    _index.apply(change)
@@ -0,0 +1,77 @@
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from .cards import card_queryset
+from .models import Profile
+
+
+POOL_KEY = 'featured:pool'
+
+# Seconds a candidate pool is served before it is rebuilt (rotates the homepage)
+POOL_TTL = getattr(settings, 'FEATURED_POOL_TTL', 600)
+
+# Candidates drawn from each source when the pool is built
+TOP_RATED = 30
+RECENTLY_ACTIVE = 30
+RANDOM_PROBES = 40
+
+
+def _random_ids(count):
+    """Ids of up to count profiles spread over the id range, in one query.
+
+    Twice count random ids are looked up at once; those that fell in gaps
+    left by deleted profiles just miss, so a sparse id range yields fewer.
+    """
+    bounds = Profile.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return set()
+    probes = {random.randint(bounds['low'], bounds['high']) for _ in range(count * 2)}
+    found = Profile.objects.filter(id__in=probes).values_list('id', flat=True)
+    return set(random.sample(list(found), min(count, len(found))))
+
+
+def build_pool():
+    """{profile_id: weight} of featured candidates, built only from index lookups.
+
+    Mixes the best-rated and most recently updated profiles with random
+    picks, so newcomers still show up. Weight favours higher ratings.
+    """
+    candidates = set(
+        Profile.objects.order_by('-rating', '-review_count').values_list('id', flat=True)[:TOP_RATED]
+    )
+    candidates.update(
+        Profile.objects.filter(updated_at__isnull=False)
+        .order_by('-updated_at').values_list('id', flat=True)[:RECENTLY_ACTIVE]
+    )
+    candidates.update(_random_ids(RANDOM_PROBES))
+    ratings = Profile.objects.filter(id__in=candidates).values_list('id', 'rating')
+    return {profile_id: 1.0 + (rating or 0.0) for profile_id, rating in ratings}
+
+
+def get_pool():
+    return cache.get_or_set(POOL_KEY, build_pool, POOL_TTL)
+
+
+def sample(pool, count, exclude=()):
+    """count ids drawn from pool without replacement, proportional to weight"""
+    # Efraimidis-Spirakis: keep the count largest u ** (1 / weight)
+    keyed = [
+        (random.random() ** (1.0 / weight), profile_id)
+        for profile_id, weight in pool.items()
+        if profile_id not in exclude
+    ]
+    keyed.sort(reverse=True)
+    return [profile_id for _, profile_id in keyed[:count]]
+
+
+def featured_profiles(user, count=3):
+    """Random, rating-weighted profiles for user's homepage, excluding their own"""
+    # One spare draw stands in for the viewer's own profile if it is picked
+    ids = sample(get_pool(), count + 1)
+    profiles = card_queryset().in_bulk(ids)
+    # Keep the sampled order; a profile deleted since the pool was built just drops out
+    picked = [profiles[profile_id] for profile_id in ids if profile_id in profiles]
+    return [profile for profile in picked if profile.user_id != user.id][:count]
@@ -1,13 +1,34 @@
 from django import forms
+from django.forms.models import ModelChoiceIterator
 from .models import (
     Profile, Course, Review, Message
 )
+from . import catalog
 import re
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
+
+class CatalogChoiceIterator(ModelChoiceIterator):
+    """Course choices from the cached catalog instead of a query per render"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for course in catalog.courses():
+            yield self.choice(course)
+
+    def __len__(self):
+        return len(catalog.courses()) + (self.field.empty_label is not None)
+
+
+class CourseMultipleChoiceField(forms.ModelMultipleChoiceField):
+    """Renders from the course catalog; submitted ids are still checked against the table"""
+    iterator = CatalogChoiceIterator
+
+
 class ProfileAddForm(forms.ModelForm):
-    courses = forms.ModelMultipleChoiceField(
+    courses = CourseMultipleChoiceField(
         queryset=Course.objects.all(),
         widget=forms.CheckboxSelectMultiple,
         required=True,
@@ -37,7 +58,7 @@ class ProfileAddForm(forms.ModelForm):
 
 
 class ProfileEditForm(forms.ModelForm):
-    courses = forms.ModelMultipleChoiceField(
+    courses = CourseMultipleChoiceField(
         queryset=Course.objects.all(),
         widget=forms.SelectMultiple(attrs={
             'class': 'form-control select2',
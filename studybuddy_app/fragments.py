@@ -0,0 +1,95 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Profile
+
+
+# Seconds a rendered fragment is kept; a version bump makes it unreachable sooner
+FRAGMENT_TTL = getattr(settings, 'FRAGMENT_CACHE_TTL', 3600)
+
+# Fragment names the {% profilecache %} tag accepts; each gets its own hit/miss counters
+FRAGMENTS = ('list_card', 'search_card')
+
+
+def _version_key(profile_id):
+    return f'fragments:version:{profile_id}'
+
+
+def _stats_key(name, outcome):
+    return f'fragments:stats:{name}:{outcome}'
+
+
+def version(profile_id):
+    """Current version stamp of a profile's fragments.
+
+    A missing stamp (never set, or evicted) restarts from the clock rather
+    than zero, so it can't land back on a version an old fragment was
+    cached under.
+    """
+    key = _version_key(profile_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, time.time_ns(), None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump(profile_ids):
+    """Invalidate every cached fragment of the given profiles"""
+    for profile_id in profile_ids:
+        try:
+            cache.incr(_version_key(profile_id))
+        except ValueError:
+            cache.set(_version_key(profile_id), time.time_ns(), None)
+
+
+def bump_users(user_ids):
+    bump(Profile.objects.filter(user_id__in=list(user_ids)).values_list('id', flat=True))
+
+
+def bump_later(profile_ids):
+    """bump() once the current transaction commits (at once outside one).
+
+    Bumping earlier lets a reader render the old rows and cache them under
+    the new version. The ids are read now, while rosters still hold them.
+    """
+    profile_ids = list(profile_ids)
+    transaction.on_commit(lambda: bump(profile_ids))
+
+
+def bump_users_later(user_ids):
+    bump_later(Profile.objects.filter(user_id__in=list(user_ids)).values_list('id', flat=True))
+
+
+def fragment_key(name, profile_id, pictures_ready=False):
+    """Cache key of one fragment of a profile.
+
+    pictures_ready is part of the key because the picture variants are
+    written by the worker, whose bump() can't reach a per-process cache.
+    """
+    return f'fragments:{name}:{profile_id}:{version(profile_id)}:{int(pictures_ready)}'
+
+
+def record(name, hit):
+    key = _stats_key(name, 'hits' if hit else 'misses')
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def stats():
+    """{fragment name: (hits, misses)} since the counters were last reset"""
+    keys = [_stats_key(name, outcome) for name in FRAGMENTS for outcome in ('hits', 'misses')]
+    counts = cache.get_many(keys)
+    return {
+        name: (counts.get(_stats_key(name, 'hits'), 0), counts.get(_stats_key(name, 'misses'), 0))
+        for name in FRAGMENTS
+    }
+
+
+def reset_stats():
+    cache.delete_many([_stats_key(name, outcome) for name in FRAGMENTS for outcome in ('hits', 'misses')])
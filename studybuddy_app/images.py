@@ -0,0 +1,71 @@
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Longest side in pixels of each pre-generated size (2x the CSS size it is shown at)
+SIZES = {
+    'small': 120,
+    'medium': 320,
+    'large': 640,
+}
+
+# Each size is saved in every format: WebP for browsers that take it, JPEG otherwise
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def variant_name(name, size, ext):
+    """Storage name of one variant, next to the original: pic.png -> pic_small.webp"""
+    stem, _ = posixpath.splitext(name)
+    return f"{stem}_{size}.{ext}"
+
+
+def variant_names(name):
+    return [variant_name(name, size, ext) for size in SIZES for ext in FORMATS]
+
+
+def _flatten(image):
+    """Upright RGB copy of image; EXIF, ICC and other metadata are not carried over"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(name, storage=default_storage):
+    """Write every size and format of the stored image name; returns the names written.
+
+    Returns [] when the file is missing or isn't an image Pillow can read.
+    """
+    try:
+        with storage.open(name) as original:
+            image = _flatten(Image.open(original))
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        return []
+
+    written = []
+    for size, longest in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((longest, longest), Image.LANCZOS)
+        for ext, options in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            target = variant_name(name, size, ext)
+            if storage.exists(target):
+                storage.delete(target)
+            written.append(storage.save(target, ContentFile(buffer.getvalue())))
+    return written
+
+
+def delete_variants(name, storage=default_storage):
+    for target in variant_names(name):
+        if storage.exists(target):
+            storage.delete(target)
@@ -0,0 +1,244 @@
+import contextvars
+import hashlib
+import json
+import logging
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import fragments, images, matching, query_budget, search
+from .models import Job, Profile
+
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker has been silent this long is assumed dead and re-run
+LOCK_TIMEOUT = getattr(settings, 'JOB_LOCK_TIMEOUT', 600)
+
+# First retry delay in seconds; doubles on every further attempt, up to RETRY_MAX_DELAY
+RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 10)
+RETRY_MAX_DELAY = getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600)
+
+_handlers = {}
+
+# (kind, args) of the jobs enqueued inside the current batch(), in order
+_batch = contextvars.ContextVar('job_batch', default=None)
+
+
+def handler(kind):
+    """Register a function as the handler of jobs of this kind"""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def _args(kwargs):
+    return json.dumps(kwargs, sort_keys=True, separators=(',', ':'))
+
+
+def _args_hash(args):
+    return hashlib.sha256(args.encode()).hexdigest()
+
+
+def enqueue(kind, **kwargs):
+    """Queue kind(**kwargs) for the worker; a no-op if identical work is already pending.
+
+    Runs in the caller's transaction, so a rolled back change takes its jobs
+    with it.
+    """
+    enqueue_many(kind, [kwargs])
+
+
+def enqueue_many(kind, kwargs_list):
+    """Queue one job per kwargs dict, skipping those already pending.
+
+    With settings.JOB_QUEUE_EAGER the handler runs right away instead, for
+    development without a worker and for tests. Inside batch() the jobs
+    wait for the end of the block.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind {kind!r}")
+    jobs = [(kind, _args(kwargs)) for kwargs in kwargs_list]
+    pending = _batch.get()
+    if pending is not None:
+        pending.update(dict.fromkeys(jobs))
+    else:
+        _queue(jobs)
+
+
+def _queue(jobs):
+    if getattr(settings, 'JOB_QUEUE_EAGER', False):
+        # Background work, so not charged to the request's query budget
+        with query_budget.recording(None):
+            for kind, args in jobs:
+                _handlers[kind](**json.loads(args))
+        return
+    if jobs:
+        # The partial unique constraint on pending (kind, args_hash) drops duplicates
+        Job.objects.bulk_create(
+            [Job(kind=kind, args=args, args_hash=_args_hash(args)) for kind, args in jobs],
+            ignore_conflicts=True,
+        )
+
+
+@contextmanager
+def batch():
+    """Run a block in a transaction and queue the jobs it enqueues at its end.
+
+    One form save fires several signal receivers, which can enqueue the same
+    work more than once; inside batch() duplicates are dropped and the rest
+    written in a single INSERT (or run once each, eagerly). Nested batches
+    join the outermost one.
+    """
+    if _batch.get() is not None:
+        yield
+        return
+    pending = {}
+    with transaction.atomic():
+        token = _batch.set(pending)
+        try:
+            yield
+        finally:
+            _batch.reset(token)
+        _queue(list(pending))
+
+
+def claim(worker, limit=10):
+    """Lock up to limit due jobs for worker and return them.
+
+    Each job is taken with a conditional UPDATE, so when workers race for
+    the same row exactly one of them wins it. Running jobs whose lock has
+    expired are taken over the same way, while they have attempts left;
+    reap() fails the rest.
+    """
+    now = timezone.now()
+    due = Q(status=Job.PENDING, run_after__lte=now)
+    expired = Q(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT),
+        attempts__lt=F('max_attempts'),
+    )
+    candidates = Job.objects.filter(due | expired).order_by('run_after', 'id').values_list('id', 'status')[:limit]
+
+    claimed = []
+    for job_id, status in candidates:
+        taken = Job.objects.filter(id=job_id, status=status).filter(due | expired).update(
+            status=Job.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(job_id)
+    return list(Job.objects.filter(id__in=claimed, locked_by=worker).order_by('run_after', 'id'))
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def run(job):
+    """Run one claimed job and record its outcome and timing; True if it succeeded"""
+    func = _handlers.get(job.kind)
+    started = time.monotonic()
+    try:
+        if func is None:
+            raise LookupError(f"No handler registered for job kind {job.kind!r}")
+        with transaction.atomic():
+            func(**json.loads(job.args))
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s %s failed (attempt %s/%s)", job.id, job, job.attempts, job.max_attempts)
+        _finish(job, started, error=error)
+        return False
+    _finish(job, started)
+    return True
+
+
+def _finish(job, started, error=None):
+    job.duration_ms = int((time.monotonic() - started) * 1000)
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    fields = ['status', 'duration_ms', 'finished_at', 'locked_by', 'locked_at']
+    if error is None:
+        job.status = Job.DONE
+    elif job.attempts >= job.max_attempts:
+        job.status = Job.FAILED
+        job.last_error = error
+        fields += ['last_error']
+    else:
+        job.status = Job.PENDING
+        job.last_error = error
+        job.run_after = job.finished_at + timedelta(seconds=retry_delay(job.attempts))
+        fields += ['last_error', 'run_after']
+    try:
+        with transaction.atomic():
+            job.save(update_fields=fields)
+    except IntegrityError:
+        # The same work was queued again meanwhile; that copy will do the retry
+        job.status = Job.DONE
+        job.save(update_fields=fields)
+
+
+def reap():
+    """Fail running jobs whose lock expired on their last attempt; returns how many.
+
+    Such a job most likely took its worker down with it every time.
+    """
+    now = timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT),
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status=Job.FAILED,
+        last_error='Lock expired on the last attempt; the worker running it died or hung',
+        locked_by='',
+        locked_at=None,
+        finished_at=now,
+    )
+
+
+def purge(older_than_days=7):
+    """Delete finished jobs older than the given age; returns how many went"""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()[0]
+
+
+# ---------------------------------------
+# Handlers
+# ---------------------------------------
+@handler('profile_courses')
+def profile_courses(profile_id, added=(), removed=()):
+    matching.change_profile_courses(profile_id, added, removed)
+
+
+@handler('course_students')
+def course_students(course_id, added=(), removed=()):
+    matching.change_course_students(course_id, added, removed)
+
+
+@handler('refresh_search')
+def refresh_search(profile_id):
+    search.refresh_documents([profile_id])
+
+
+@handler('picture_variants')
+def picture_variants(profile_id):
+    profile = Profile.objects.filter(id=profile_id).only('picture').first()
+    if profile is None or not profile.picture:
+        return
+    name = profile.picture.name
+    if images.generate_variants(name, profile.picture.storage):
+        # Only if the picture wasn't replaced meanwhile; its own job will follow
+        if Profile.objects.filter(id=profile_id, picture=name).update(picture_variants=name):
+            fragments.bump_later([profile_id])
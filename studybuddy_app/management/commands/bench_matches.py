@@ -0,0 +1,85 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from studybuddy_app.matching import change_profile_courses
+from studybuddy_app.models import Course, Profile, Match
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark matching a profile to its courses' rosters on a seeded, throw-away dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 50000])
+        parser.add_argument('--courses', type=int, default=200, help="Number of courses in the catalog")
+        parser.add_argument('--per-profile', type=int, default=5, help="Courses taken by each profile")
+        parser.add_argument('--samples', type=int, default=20, help="Profiles to time per size")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self._run(size, options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _run(self, size, options):
+        rng = random.Random(options['seed'])
+        prefix = f"bench{size}_"
+
+        courses = Course.objects.bulk_create([
+            Course(code=f"B{i:05d}", name=f"Bench course {i}")
+            for i in range(options['courses'])
+        ])
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}{i}") for i in range(size)
+        ], batch_size=1000)
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+        profiles = Profile.objects.bulk_create([
+            Profile(user=u, fname="Bench", lname=str(i), email=f"{i}@bench.local")
+            for i, u in enumerate(users)
+        ], batch_size=1000)
+        if profiles[0].pk is None:
+            profiles = list(Profile.objects.filter(user__username__startswith=prefix).order_by('id'))
+
+        # Bulk-created enrolments fire no signals, so no profile is matched yet
+        through = Profile.courses.through
+        enrolments = through.objects.bulk_create([
+            through(profile_id=p.id, course_id=c.id)
+            for p in profiles
+            for c in rng.sample(courses, options['per_profile'])
+        ], batch_size=5000)
+        joined = {}
+        for enrolment in enrolments:
+            joined.setdefault(enrolment.profile_id, []).append(enrolment.course_id)
+
+        samples = rng.sample(profiles, min(options['samples'], len(profiles)))
+        timings, queries, rows = [], 0, 0
+        for profile in samples:
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                # What the profile_courses job runs for a profile that joined its courses
+                rows += change_profile_courses(profile.id, added=joined[profile.id])[0]
+                timings.append(time.perf_counter() - start)
+            queries += len(ctx.captured_queries)
+
+        timings.sort()
+        self.stdout.write(
+            f"{size:>7} profiles: "
+            f"median {timings[len(timings) // 2] * 1000:.1f} ms, "
+            f"max {timings[-1] * 1000:.1f} ms, "
+            f"{queries / len(samples):.1f} queries/profile, "
+            f"{rows // len(samples)} pairs/profile, "
+            f"{Match.objects.count()} matches total"
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from studybuddy_app.fragments import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counts of the cached profile card fragments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero the counters after printing them")
+
+    def handle(self, *args, **options):
+        for name, (hits, misses) in stats().items():
+            total = hits + misses
+            ratio = f"{hits / total:.1%}" if total else "n/a"
+            self.stdout.write(f"{name}: {hits} hit(s), {misses} miss(es), hit rate {ratio}")
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from studybuddy_app import fragments
+from studybuddy_app.images import generate_variants, variant_names
+from studybuddy_app.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Generate the thumbnail and WebP variants of profile pictures that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that already exist")
+
+    def handle(self, *args, **options):
+        generated = skipped = failed = 0
+        for profile in Profile.objects.exclude(picture='').exclude(picture__isnull=True).only('id', 'picture'):
+            storage = profile.picture.storage
+            name = profile.picture.name
+            if not options['force'] and all(storage.exists(target) for target in variant_names(name)):
+                skipped += 1
+            elif generate_variants(name, storage):
+                generated += 1
+            else:
+                failed += 1
+                self.stderr.write(f"Could not read {name} (profile {profile.id})")
+                continue
+            # Pages serve the variants from now on, unless the picture was replaced meanwhile
+            marked = Profile.objects.filter(id=profile.id, picture=name).exclude(picture_variants=name)
+            if marked.update(picture_variants=name):
+                fragments.bump([profile.id])
+        self.stdout.write(self.style.SUCCESS(
+            f"Pictures: {generated} generated, {skipped} already done, {failed} unreadable"
+        ))
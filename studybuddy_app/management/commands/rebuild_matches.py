@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from studybuddy_app.matching import sync_course_matches
+from studybuddy_app.models import Course
+
+
+def _init_worker():
+    # Spawned workers start from a blank interpreter; forked ones inherit the
+    # app registry but must not share the parent's database connections.
+    django.setup()
+    connections.close_all()
+
+
+def _sync_chunk(course_ids, dry_run):
+    return [(course_id, *sync_course_matches(course_id, dry_run=dry_run)) for course_id in course_ids]
+
+
+class Command(BaseCommand):
+    help = "Recompute the Match table course by course, writing only the rows that differ"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', action='append', default=[], metavar='CODE',
+                            help="Only rebuild this course (repeatable)")
+        parser.add_argument('--dry-run', action='store_true', help="Report changes without writing them")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (1 runs in-process)")
+        parser.add_argument('--chunk-size', type=int, default=20, help="Courses handed to a worker at a time")
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by('id')
+        if options['course']:
+            courses = courses.filter(code__in=options['course'])
+            unknown = set(options['course']) - set(courses.values_list('code', flat=True))
+            if unknown:
+                raise CommandError(f"Unknown course code(s): {', '.join(sorted(unknown))}")
+        course_ids = list(courses.values_list('id', flat=True))
+
+        size = max(options['chunk_size'], 1)
+        chunks = [course_ids[i:i + size] for i in range(0, len(course_ids), size)]
+        dry_run = options['dry_run']
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite' and not dry_run:
+            # SQLite allows a single writer; parallel workers would just fight over the lock.
+            self.stdout.write(self.style.WARNING("SQLite backend: running with a single worker"))
+            workers = 1
+
+        start = time.perf_counter()
+        added = removed = done = 0
+        for results in self._run(chunks, dry_run, workers):
+            for _course_id, course_added, course_removed in results:
+                added += course_added
+                removed += course_removed
+            done += len(results)
+            self.stdout.write(f"[{done}/{len(course_ids)}] courses, +{added} -{removed} matches")
+
+        verb = "would change" if dry_run else "changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(course_ids)} courses in {time.perf_counter() - start:.1f}s: "
+            f"{verb} {added + removed} rows ({added} added, {removed} removed)"
+        ))
+
+    def _run(self, chunks, dry_run, workers):
+        if workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield _sync_chunk(chunk, dry_run)
+            return
+
+        # Children open their own connections; don't hand them ours.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_sync_chunk, chunk, dry_run) for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
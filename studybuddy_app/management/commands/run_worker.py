@@ -0,0 +1,62 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from studybuddy_app import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (match recomputation, search refresh, thumbnails)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due instead of waiting")
+        parser.add_argument('--batch', type=int, default=10, help="Jobs claimed per round (default 10)")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--purge-days', type=int, default=7, help="Delete done jobs older than this")
+        parser.add_argument('--purge-every', type=float, default=3600,
+                            help="Seconds between purges of old jobs (default hourly)")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        purged = self.tidy(options['purge_days'])
+        self.stdout.write(f"Worker {worker} started ({purged} old job(s) purged)")
+        tidied_at = time.monotonic()
+
+        done = failed = 0
+        while not self.stopping:
+            if time.monotonic() - tidied_at > options['purge_every']:
+                self.tidy(options['purge_days'])
+                tidied_at = time.monotonic()
+            claimed = jobs.claim(worker, limit=options['batch'])
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            for job in claimed:
+                if jobs.run(job):
+                    done += 1
+                    self.stdout.write(f"{job} in {job.duration_ms} ms")
+                else:
+                    failed += 1
+                    self.stderr.write(f"{job} after {job.duration_ms} ms, attempt {job.attempts}/{job.max_attempts}")
+
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} stopped: {done} done, {failed} failed"))
+
+    def tidy(self, purge_days):
+        """Fail jobs abandoned on their last attempt and delete old finished ones"""
+        reaped = jobs.reap()
+        if reaped:
+            self.stderr.write(f"{reaped} job(s) lost their worker on the last attempt and were failed")
+        return jobs.purge(purge_days)
+
+    def stop(self, signum, frame):
+        # Finish the job in hand, then leave the loop
+        self.stopping = True
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from studybuddy_app.reviews import sync_profile_aggregates, sync_site_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute Profile review aggregates and site-wide ReviewStats from the Review table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without writing it")
+
+    def handle(self, *args, **options):
+        stale = sync_profile_aggregates(dry_run=options['dry_run'])
+        verb = "would fix" if options['dry_run'] else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"Profile review aggregates: {verb} {stale} profile(s)"))
+
+        drifted = sync_site_stats(dry_run=options['dry_run'])
+        state = f"{verb} drift" if drifted else "in sync"
+        self.stdout.write(self.style.SUCCESS(f"Site review stats: {state}"))
@@ -0,0 +1,165 @@
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Match, ProfileCourse
+
+
+def ordered_pair(a_id, b_id):
+    """Return two profile ids ordered so that profile1.id < profile2.id"""
+    return (a_id, b_id) if a_id < b_id else (b_id, a_id)
+
+
+def build_matches(profile_id, pairs):
+    """Build unsaved Match rows for (other_profile_id, course_id) pairs"""
+    rows = []
+    for other_id, course_id in pairs:
+        profile1_id, profile2_id = ordered_pair(profile_id, other_id)
+        rows.append(Match(profile1_id=profile1_id, profile2_id=profile2_id, course_id=course_id))
+    return rows
+
+
+def shared_courses(profile_id, other_ids):
+    """Map each of other_ids to the courses it shares with profile_id (one query)"""
+    other_ids = list(other_ids)
+    matches = (
+        Match.objects
+        .filter(
+            Q(profile1_id=profile_id, profile2_id__in=other_ids) |
+            Q(profile2_id=profile_id, profile1_id__in=other_ids)
+        )
+        .select_related('course')
+        .order_by('course__code')
+    )
+    courses = {other_id: [] for other_id in other_ids}
+    for match in matches:
+        other_id = match.profile2_id if match.profile1_id == profile_id else match.profile1_id
+        courses[other_id].append(match.course)
+    return courses
+
+
+def add_course_matches(profile_id, course_ids):
+    """Pair a profile with the rosters of courses it just joined"""
+    pairs = (
+        ProfileCourse.objects
+        .filter(course_id__in=course_ids)
+        .exclude(profile_id=profile_id)
+        .values_list('profile_id', 'course_id')
+    )
+    return _insert(build_matches(profile_id, pairs))
+
+
+def add_course_students(course_id, profile_ids):
+    """Pair students just added to a course with the rest of its roster"""
+    roster = ProfileCourse.objects.filter(course_id=course_id).values_list('profile_id', flat=True)
+    roster = list(roster)
+    pairs = {
+        ordered_pair(profile_id, other_id)
+        for profile_id in profile_ids
+        for other_id in roster
+        if other_id != profile_id
+    }
+    return _insert([
+        Match(profile1_id=profile1_id, profile2_id=profile2_id, course_id=course_id)
+        for profile1_id, profile2_id in pairs
+    ])
+
+
+def remove_course_matches(profile_id, course_ids=None, keep=()):
+    """Delete a profile's matches for courses it left (all courses if None), except those in keep"""
+    matches = Match.objects.filter(Q(profile1_id=profile_id) | Q(profile2_id=profile_id))
+    if course_ids is not None:
+        matches = matches.filter(course_id__in=course_ids)
+    if keep:
+        matches = matches.exclude(course_id__in=keep)
+    return matches.delete()[0]
+
+
+def remove_course_students(course_id, profile_ids=None, keep=()):
+    """Delete matches of students removed from a course (whole roster if None).
+
+    Pairs whose profiles are both in keep are left alone.
+    """
+    matches = Match.objects.filter(course_id=course_id)
+    if profile_ids is not None:
+        matches = matches.filter(Q(profile1_id__in=profile_ids) | Q(profile2_id__in=profile_ids))
+    if keep:
+        matches = matches.exclude(profile1_id__in=keep, profile2_id__in=keep)
+    return matches.delete()[0]
+
+
+def change_profile_courses(profile_id, added=(), removed=()):
+    """Apply courses a profile joined and left to its matches; returns (added, removed).
+
+    removed=None means every course it left. The change is checked against
+    the profile's courses as they are now, so it can be applied late, twice
+    or after a later change to the same courses (see jobs.py).
+    """
+    with transaction.atomic():
+        current = set(ProfileCourse.objects.filter(profile_id=profile_id).values_list('course_id', flat=True))
+        joined = current.intersection(added)
+        created = add_course_matches(profile_id, joined) if joined else 0
+        if removed is None:
+            deleted = remove_course_matches(profile_id, keep=current)
+        else:
+            left = set(removed) - current
+            deleted = remove_course_matches(profile_id, left) if left else 0
+    return created, deleted
+
+
+def change_course_students(course_id, added=(), removed=()):
+    """Apply students who joined and left a course to its matches; returns (added, removed).
+
+    removed=None means everyone who left. Checked against the current roster,
+    like change_profile_courses().
+    """
+    with transaction.atomic():
+        roster = set(ProfileCourse.objects.filter(course_id=course_id).values_list('profile_id', flat=True))
+        joined = roster.intersection(added)
+        created = add_course_students(course_id, joined) if joined else 0
+        if removed is None:
+            deleted = remove_course_students(course_id, keep=roster)
+        else:
+            left = set(removed) - roster
+            deleted = remove_course_students(course_id, left) if left else 0
+    return created, deleted
+
+
+def _insert(rows):
+    if rows:
+        Match.objects.bulk_create(rows, ignore_conflicts=True, batch_size=1000)
+    return len(rows)
+
+
+def diff_course_matches(course_id):
+    """Compare a course's Match rows with its roster.
+
+    Returns (missing, stale): ordered profile id pairs that should exist but
+    don't, and ids of Match rows whose pair no longer shares the course.
+    """
+    roster = sorted(ProfileCourse.objects.filter(course_id=course_id).values_list('profile_id', flat=True))
+    expected = set(combinations(roster, 2))
+    existing = {
+        (profile1_id, profile2_id): match_id
+        for match_id, profile1_id, profile2_id in
+        Match.objects.filter(course_id=course_id).values_list('id', 'profile1_id', 'profile2_id')
+    }
+    missing = expected - existing.keys()
+    stale = [match_id for pair, match_id in existing.items() if pair not in expected]
+    return missing, stale
+
+
+def sync_course_matches(course_id, dry_run=False):
+    """Bring a course's Match rows in line with its roster; returns (added, removed)"""
+    with transaction.atomic():
+        missing, stale = diff_course_matches(course_id)
+        if dry_run:
+            return len(missing), len(stale)
+        if stale:
+            Match.objects.filter(id__in=stale).delete()
+        added = _insert([
+            Match(profile1_id=profile1_id, profile2_id=profile2_id, course_id=course_id)
+            for profile1_id, profile2_id in missing
+        ])
+    return added, len(stale)
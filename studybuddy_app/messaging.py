@@ -0,0 +1,287 @@
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.timesince import timesince
+
+from .models import Conversation, Message
+
+
+# Seconds a cached unread total is trusted before it is recounted from Conversation
+UNREAD_COUNT_TTL = getattr(settings, 'UNREAD_COUNT_TTL', 300)
+
+
+def ordered_users(a_id, b_id):
+    """Return two user ids ordered so that user1.id < user2.id"""
+    return (a_id, b_id) if a_id < b_id else (b_id, a_id)
+
+
+class ConversationList:
+    """A user's conversations, most recent first, as a sequence Paginator can slice.
+
+    The user is user1 in some conversations and user2 in others. A slice
+    reads each side through its own (userN, -last_activity) index, cut at
+    the slice's end, and merges them; an OR of the two sides would sort all
+    of the user's conversations for every page.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        conversations = Conversation.objects.select_related('user1', 'user2', 'last_message').order_by('-last_activity')
+        self.sides = (conversations.filter(user1=user), conversations.filter(user2=user))
+
+    def count(self):
+        return Conversation.objects.filter(Q(user1=self.user) | Q(user2=self.user)).count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        merged = heapq.merge(
+            *(side[:key.stop] for side in self.sides),
+            key=lambda conversation: conversation.last_activity,
+            reverse=True,
+        )
+        return list(islice(merged, key.start, key.stop))
+
+
+def conversations_for(user):
+    """A user's conversations, most recent first, ready for the inbox"""
+    return ConversationList(user)
+
+
+def thread_messages(user, partner):
+    """A chat thread as its two one-way halves: (user to partner, partner to user).
+
+    Each half is one range of the (sender, receiver, -created_at, -id) index.
+    The paging helpers below query the halves separately and merge them; an
+    OR of both directions would make the database sort the whole thread.
+    """
+    return (
+        Message.objects.filter(sender=user, receiver=partner),
+        Message.objects.filter(sender=partner, receiver=user),
+    )
+
+
+def encode_cursor(message):
+    return f"{message.created_at.isoformat()}|{message.id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor back into (created_at, id); None if it is malformed"""
+    try:
+        created_at, message_id = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _before(created_at, message_id):
+    # A range on created_at the index can seek into, minus the ties at or past the id
+    return Q(created_at__lte=created_at) & ~Q(created_at=created_at, id__gte=message_id)
+
+
+def _after(created_at, message_id):
+    return Q(created_at__gte=created_at) & ~Q(created_at=created_at, id__lte=message_id)
+
+
+def _position(message):
+    return message.created_at, message.id
+
+
+def messages_before(halves, cursor=None, limit=30):
+    """Keyset page of messages older than cursor, oldest first.
+
+    halves are querysets paged through together, as thread_messages gives
+    them. Each walks the (created_at, id) order backwards from the cursor
+    and stops after limit + 1 rows, so a page is a few short range scans no
+    matter how deep into the history it is. Returns (messages, cursor for
+    the next older page or None).
+    """
+    position = decode_cursor(cursor) if cursor else None
+    page = []
+    for messages in halves:
+        if position:
+            messages = messages.filter(_before(*position))
+        page += messages.order_by('-created_at', '-id')[:limit + 1]
+    page.sort(key=_position, reverse=True)
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return page, encode_cursor(page[0]) if has_more else None
+
+
+def thread_group(a_id, b_id):
+    """Channel layer group both participants of a chat thread listen on"""
+    return 'chat_{}_{}'.format(*ordered_users(a_id, b_id))
+
+
+def message_payload(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender_id': message.sender_id,
+        'created_at': message.created_at.isoformat(),
+        'timesince': timesince(message.created_at),
+    }
+
+
+def messages_after(halves, after_id, limit=100):
+    """Messages of halves (see thread_messages) newer than message after_id,
+    oldest first (at most limit)"""
+    position = Message.objects.filter(id=after_id).values_list('created_at', 'id').first() if after_id else None
+    page = []
+    for messages in halves:
+        if position:
+            messages = messages.filter(_after(*position))
+        elif after_id:
+            # That message is gone; ids still tell what came after it
+            messages = messages.filter(id__gt=after_id)
+        page += messages.order_by('created_at', 'id')[:limit]
+    page.sort(key=_position)
+    return page[:limit]
+
+
+def unread_count(user, partner):
+    """Messages from partner that user has not read yet, from the Conversation row"""
+    user1_id, user2_id = ordered_users(user.id, partner.id)
+    conversation = Conversation.objects.filter(user1_id=user1_id, user2_id=user2_id).first()
+    return conversation.unread_for(user) if conversation else 0
+
+
+def save_message(message, client_id=None):
+    """Save a new Message and update its Conversation in the same transaction.
+
+    Once committed, the message is pushed to both participants' open chat
+    sockets; client_id lets the sending tab match it to its optimistic copy.
+    """
+    with transaction.atomic():
+        message.save()
+        record_message(message)
+        transaction.on_commit(lambda: broadcast_message(message, client_id))
+    return message
+
+
+def broadcast_message(message, client_id=None):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        thread_group(message.sender_id, message.receiver_id),
+        {'type': 'chat.message', 'message': message_payload(message), 'client_id': client_id},
+    )
+
+
+def record_message(message):
+    """Make message the conversation's latest and bump the receiver's unread count"""
+    if message.sender_id == message.receiver_id:
+        return
+    user1_id, user2_id = ordered_users(message.sender_id, message.receiver_id)
+    conversation, _ = Conversation.objects.get_or_create(
+        user1_id=user1_id, user2_id=user2_id,
+        defaults={'last_activity': message.created_at},
+    )
+    unread = 'unread_user1' if message.receiver_id == user1_id else 'unread_user2'
+    Conversation.objects.filter(pk=conversation.pk).update(**{
+        'last_message': message,
+        'last_activity': message.created_at,
+        unread: F(unread) + 1,
+    })
+    transaction.on_commit(lambda: _bump_total_unread(message.receiver_id))
+
+
+def mark_read(user, partner, up_to=None):
+    """Move user's read pointer in the thread with partner up to message id
+    up_to (default: the thread's latest message).
+
+    A single conditional UPDATE of the Conversation row, which also resets
+    the unread counter to the messages past the new pointer. Pointers only
+    move forward; returns the new pointer, or None when nothing changed.
+    """
+    user1_id, user2_id = ordered_users(user.id, partner.id)
+    side = 1 if user.id == user1_id else 2
+    pointer, unread = f'last_read_user{side}', f'unread_user{side}'
+    conversation = Conversation.objects.filter(user1_id=user1_id, user2_id=user2_id)
+
+    with transaction.atomic():
+        if up_to is None:
+            changed = conversation.filter(**{f'{pointer}__lt': F('last_message_id')}).update(**{
+                pointer: F('last_message_id'),
+                unread: 0,
+            })
+            if changed:
+                up_to = conversation.values_list(pointer, flat=True).first()
+        else:
+            remaining = (
+                Message.objects
+                .filter(sender_id=partner.id, receiver_id=user.id, id__gt=up_to)
+                .order_by()
+                .values('receiver_id')
+                .annotate(count=Count('id'))
+                .values('count')
+            )
+            changed = conversation.filter(**{f'{pointer}__lt': up_to}).update(**{
+                pointer: up_to,
+                unread: Coalesce(Subquery(remaining), Value(0)),
+            })
+        if not changed:
+            return None
+        transaction.on_commit(lambda: cache.delete(_unread_key(user.id)))
+        transaction.on_commit(lambda: broadcast_read(user.id, partner.id, up_to))
+    return up_to
+
+
+def broadcast_read(reader_id, partner_id, last_read):
+    """Tell open chat sockets that reader has read the thread up to last_read"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        thread_group(reader_id, partner_id),
+        {'type': 'chat.read', 'reader_id': reader_id, 'last_read': last_read},
+    )
+
+
+def partner_read_up_to(user, partner):
+    """Id of the newest message partner has read in their thread with user
+    (0 if none); every message user sent up to it shows as seen"""
+    user1_id, user2_id = ordered_users(user.id, partner.id)
+    conversation = Conversation.objects.filter(user1_id=user1_id, user2_id=user2_id).first()
+    return conversation.last_read_for(partner) if conversation else 0
+
+
+def _unread_key(user_id):
+    return f'unread:{user_id}'
+
+
+def _bump_total_unread(user_id):
+    try:
+        cache.incr(_unread_key(user_id))
+    except ValueError:
+        # Not cached; the next read counts it from the database
+        pass
+
+
+def total_unread(user_id):
+    """Messages waiting for user_id across all conversations.
+
+    Served from a per-user cache counter that record_message increments and
+    mark_read drops; a miss sums the Conversation counters once.
+    """
+    key = _unread_key(user_id)
+    total = cache.get(key)
+    if total is None:
+        total = Conversation.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)).aggregate(total=Sum(
+            Case(When(user1_id=user_id, then=F('unread_user1')), default=F('unread_user2'))
+        ))['total'] or 0
+        cache.add(key, total, UNREAD_COUNT_TTL)
+    return total
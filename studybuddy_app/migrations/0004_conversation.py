@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_conversations(apps, schema_editor):
+    Message = apps.get_model('studybuddy_app', 'Message')
+    Conversation = apps.get_model('studybuddy_app', 'Conversation')
+
+    conversations = {}
+    messages = (
+        Message.objects
+        .exclude(sender=models.F('receiver'))
+        .order_by('created_at', 'id')
+        .values_list('id', 'sender_id', 'receiver_id', 'created_at', 'read')
+        .iterator()
+    )
+    for message_id, sender_id, receiver_id, created_at, read in messages:
+        pair = (sender_id, receiver_id) if sender_id < receiver_id else (receiver_id, sender_id)
+        conversation = conversations.setdefault(pair, Conversation(user1_id=pair[0], user2_id=pair[1]))
+        conversation.last_message_id = message_id
+        conversation.last_activity = created_at
+        if not read:
+            if receiver_id == pair[0]:
+                conversation.unread_user1 += 1
+            else:
+                conversation.unread_user2 += 1
+    Conversation.objects.bulk_create(conversations.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('studybuddy_app', '0003_alter_profile_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField()),
+                ('unread_user1', models.PositiveIntegerField(default=0)),
+                ('unread_user2', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='studybuddy_app.message')),
+                ('user1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_first', to=settings.AUTH_USER_MODEL)),
+                ('user2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_second', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_activity'],
+                'indexes': [models.Index(fields=['user1', '-last_activity'], name='studybuddy__user1_i_380bb9_idx'), models.Index(fields=['user2', '-last_activity'], name='studybuddy__user2_i_0ae3ea_idx')],
+                'unique_together': {('user1', 'user2')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
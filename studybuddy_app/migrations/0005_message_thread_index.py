@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0004_conversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', '-created_at', '-id'], name='studybuddy__sender__792c31_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FTS_TABLE = 'studybuddy_app_profilesearch_fts'
+
+SQLITE_FORWARD = [
+    # External-content FTS5 index over ProfileSearch.document, kept in sync by triggers
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        document, content='studybuddy_app_profilesearch', content_rowid='profile_id'
+    )""",
+    f"""CREATE TRIGGER studybuddy_app_profilesearch_ai AFTER INSERT ON studybuddy_app_profilesearch BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.profile_id, new.document);
+    END""",
+    f"""CREATE TRIGGER studybuddy_app_profilesearch_ad AFTER DELETE ON studybuddy_app_profilesearch BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) VALUES ('delete', old.profile_id, old.document);
+    END""",
+    f"""CREATE TRIGGER studybuddy_app_profilesearch_au AFTER UPDATE ON studybuddy_app_profilesearch BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) VALUES ('delete', old.profile_id, old.document);
+        INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.profile_id, new.document);
+    END""",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS studybuddy_app_profilesearch_au",
+    "DROP TRIGGER IF EXISTS studybuddy_app_profilesearch_ad",
+    "DROP TRIGGER IF EXISTS studybuddy_app_profilesearch_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRESQL_FORWARD = [
+    """ALTER TABLE studybuddy_app_profilesearch ADD COLUMN vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED""",
+    "CREATE INDEX studybuddy_app_profilesearch_vector_gin ON studybuddy_app_profilesearch USING gin (vector)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS studybuddy_app_profilesearch_vector_gin",
+    "ALTER TABLE studybuddy_app_profilesearch DROP COLUMN IF EXISTS vector",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE})
+
+
+def backfill_documents(apps, schema_editor):
+    from studybuddy_app.search import document_text
+
+    Profile = apps.get_model('studybuddy_app', 'Profile')
+    ProfileSearch = apps.get_model('studybuddy_app', 'ProfileSearch')
+    profiles = Profile.objects.select_related('user').prefetch_related('courses')
+    ProfileSearch.objects.bulk_create([
+        ProfileSearch(profile_id=profile.id, document=document_text(
+            profile.user.username, profile.fname, profile.lname, profile.major,
+            profile.study_methods, profile.bio,
+            [(course.code, course.name) for course in profile.courses.all()],
+        ))
+        for profile in profiles
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0005_message_thread_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileSearch',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='studybuddy_app.profile')),
+                ('document', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Profile = apps.get_model('studybuddy_app', 'Profile')
+    Review = apps.get_model('studybuddy_app', 'Review')
+    rows = Review.objects.order_by().values('reviewed_user_id').annotate(
+        count=models.Count('id'), total=models.Sum('rating'),
+    )
+    aggregates = {row['reviewed_user_id']: (row['count'], row['total'] or 0) for row in rows}
+    profiles = []
+    for profile in Profile.objects.filter(user_id__in=aggregates):
+        profile.review_count, profile.rating_sum = aggregates[profile.user_id]
+        profile.rating = profile.rating_sum / profile.review_count
+        profiles.append(profile)
+    Profile.objects.bulk_update(profiles, ['review_count', 'rating_sum', 'rating'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0006_profile_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-rating', '-review_count'], name='studybuddy__rating_db11d6_idx'),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:36
+
+from django.db import migrations, models
+
+
+def backfill_review_stats(apps, schema_editor):
+    Review = apps.get_model('studybuddy_app', 'Review')
+    ReviewStats = apps.get_model('studybuddy_app', 'ReviewStats')
+    stats = Review.objects.aggregate(
+        total_reviews=models.Count('id'),
+        rating_sum=models.Sum('rating'),
+        five_star_count=models.Count('id', filter=models.Q(rating=5)),
+        active_reviewers=models.Count('reviewer', distinct=True),
+    )
+    ReviewStats.objects.create(pk=1, **{field: value or 0 for field, value in stats.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0007_profile_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_reviews', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('five_star_count', models.PositiveIntegerField(default=0)),
+                ('active_reviewers', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'review stats',
+            },
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0008_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['lname', 'fname', 'id'], name='studybuddy__lname_4613de_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='studybuddy__created_28011b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', '-created_at', '-id'], name='studybuddy__rating_72b954_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-updated_at'], name='studybuddy__updated_631cfb_idx'),
+        ),
+    ]
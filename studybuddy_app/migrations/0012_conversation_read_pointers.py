@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:56
+
+from django.db import migrations, models
+
+
+def read_flags_to_pointers(apps, schema_editor):
+    """Point each user at the newest message they had read in every thread,
+    then recount their unread messages as the ones past that pointer"""
+    Message = apps.get_model('studybuddy_app', 'Message')
+    Conversation = apps.get_model('studybuddy_app', 'Conversation')
+
+    received = {}
+    messages = (
+        Message.objects
+        .exclude(sender=models.F('receiver'))
+        .order_by('id')
+        .values_list('id', 'sender_id', 'receiver_id', 'read')
+        .iterator()
+    )
+    for message_id, sender_id, receiver_id, read in messages:
+        entry = received.setdefault((receiver_id, sender_id), [0, []])
+        if read:
+            entry[0] = message_id
+        entry[1].append(message_id)
+
+    conversations = list(Conversation.objects.all())
+    for conversation in conversations:
+        for side, user_id, partner_id in ((1, conversation.user1_id, conversation.user2_id),
+                                          (2, conversation.user2_id, conversation.user1_id)):
+            last_read, ids = received.get((user_id, partner_id), (0, []))
+            setattr(conversation, f'last_read_user{side}', last_read)
+            setattr(conversation, f'unread_user{side}', sum(1 for message_id in ids if message_id > last_read))
+    Conversation.objects.bulk_update(
+        conversations,
+        ['last_read_user1', 'last_read_user2', 'unread_user1', 'unread_user2'],
+        batch_size=1000,
+    )
+
+
+def pointers_to_read_flags(apps, schema_editor):
+    Message = apps.get_model('studybuddy_app', 'Message')
+    Conversation = apps.get_model('studybuddy_app', 'Conversation')
+
+    for conversation in Conversation.objects.iterator():
+        Message.objects.filter(
+            sender_id=conversation.user2_id, receiver_id=conversation.user1_id, id__lte=conversation.last_read_user1,
+        ).update(read=True)
+        Message.objects.filter(
+            sender_id=conversation.user1_id, receiver_id=conversation.user2_id, id__lte=conversation.last_read_user2,
+        ).update(read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_user1',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_user2',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(read_flags_to_pointers, pointers_to_read_flags),
+        migrations.RemoveField(
+            model_name='message',
+            name='read',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0012_conversation_read_pointers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['profile2', 'profile1', 'course'], name='studybuddy__profile_5c8087_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewed_user', '-created_at'], name='studybuddy__reviewe_07bdb4_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:43
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from studybuddy_app.images import variant_names
+
+
+def mark_existing_variants(apps, schema_editor):
+    """Record the pictures whose variants were already generated"""
+    Profile = apps.get_model('studybuddy_app', 'Profile')
+    for profile_id, name in Profile.objects.exclude(picture='').exclude(picture=None).values_list('id', 'picture'):
+        if all(default_storage.exists(variant) for variant in variant_names(name)):
+            Profile.objects.filter(id=profile_id).update(picture_variants=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='picture_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(mark_existing_variants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:59
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_args(apps, schema_editor):
+    Job = apps.get_model('studybuddy_app', 'Job')
+    for job_id, args in Job.objects.values_list('id', 'args').iterator():
+        Job.objects.filter(id=job_id).update(args_hash=hashlib.sha256(args.encode()).hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studybuddy_app', '0014_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='job',
+            name='unique_pending_job',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='args_hash',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='args',
+            field=models.TextField(default='{}'),
+        ),
+        migrations.RunPython(hash_args, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('kind', 'args_hash'), name='unique_pending_job_hash'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -34,11 +35,24 @@ class Profile(TimestampModel):
     courses = models.ManyToManyField(Course, blank=True, related_name='students')
     study_methods = models.CharField(max_length=200, blank=True)
     rating = models.FloatField(default=0.0, validators=[MinValueValidator(0.0), MaxValueValidator(5.0)])
+    # Maintained from Review rows by studybuddy_app.reviews; rating = rating_sum / review_count
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
     picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Name of the picture whose size variants have been written (images.py); pages
+    # show the original picture until it matches, so a new upload never 404s
+    picture_variants = models.CharField(max_length=100, blank=True, default='', editable=False)
     major = models.CharField(max_length=100, blank=True, null=True)
 
     class Meta:
         ordering = ['lname', 'fname']
+        indexes = [
+            models.Index(fields=['-rating', '-review_count']),
+            # Keyset paging of profile_list walks (lname, fname, id)
+            models.Index(fields=['lname', 'fname', 'id']),
+            # Recently active candidates for the featured pool (featured.py)
+            models.Index(fields=['-updated_at']),
+        ]
 
     def __str__(self):
         return f"{self.fname} {self.lname}"
@@ -46,6 +60,27 @@ class Profile(TimestampModel):
     def full_name(self):
         return f"{self.fname} {self.lname}"
 
+    @property
+    def has_picture_variants(self):
+        return bool(self.picture) and self.picture_variants == self.picture.name
+
+
+# Through table behind Profile.courses (columns: profile_id, course_id)
+ProfileCourse = Profile.courses.through
+
+#--PROFILE SEARCH--
+class ProfileSearch(models.Model):
+    """Denormalized full-text search document for a Profile.
+
+    The backend index over `document` (an FTS5 table on SQLite, a generated
+    tsvector column with a GIN index on Postgres) is created in migration 0006.
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True, related_name='search')
+    document = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Search document for {self.profile_id}"
+
 #--STUDY MATCH--
 class Match(TimestampModel):
     profile1 = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='matches_as_first')
@@ -54,6 +89,11 @@ class Match(TimestampModel):
 
     class Meta:
         unique_together = ('profile1', 'profile2', 'course')
+        indexes = [
+            # Mirror of the unique index, so "matches of profile X" is an index-only
+            # lookup from either side of the pair
+            models.Index(fields=['profile2', 'profile1', 'course']),
+        ]
 
     def __str__(self):
         return f"{self.profile1.full_name()} & {self.profile2.full_name()} — {self.course.code}"
@@ -62,16 +102,55 @@ class Match(TimestampModel):
     
 class Message(models.Model):
     content = models.TextField()
-    read = models.BooleanField(default=False)
     receiver = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     replied_to = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL)
 
+    class Meta:
+        indexes = [
+            # Keyset paging of a chat thread walks (created_at, id) per direction
+            models.Index(fields=['sender', 'receiver', '-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"From {self.sender.username} to {self.receiver.username}"
 
+#--CONVERSATION--
+class Conversation(models.Model):
+    """One row per pair of users who have exchanged messages (user1.id < user2.id)"""
+    user1 = models.ForeignKey(User, related_name='conversations_as_first', on_delete=models.CASCADE)
+    user2 = models.ForeignKey(User, related_name='conversations_as_second', on_delete=models.CASCADE)
+    last_message = models.ForeignKey(Message, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    last_activity = models.DateTimeField()
+    # Id of the newest message each user has read in this thread (0: none yet)
+    last_read_user1 = models.PositiveBigIntegerField(default=0)
+    last_read_user2 = models.PositiveBigIntegerField(default=0)
+    # Messages to each user newer than their read pointer, kept in step with it
+    unread_user1 = models.PositiveIntegerField(default=0)
+    unread_user2 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user1', 'user2')
+        ordering = ['-last_activity']
+        indexes = [
+            models.Index(fields=['user1', '-last_activity']),
+            models.Index(fields=['user2', '-last_activity']),
+        ]
+
+    def __str__(self):
+        return f"{self.user1.username} & {self.user2.username}"
+
+    def other(self, user):
+        return self.user2 if self.user1_id == user.id else self.user1
+
+    def unread_for(self, user):
+        return self.unread_user1 if self.user1_id == user.id else self.unread_user2
+
+    def last_read_for(self, user):
+        return self.last_read_user1 if self.user1_id == user.id else self.last_read_user2
+
 #--REVIEW--
 class Review(TimestampModel):
     reviewer = models.ForeignKey(
@@ -92,7 +171,86 @@ class Review(TimestampModel):
     class Meta:
         unique_together = [['reviewer', 'reviewed_user']]
         ordering = ['-created_at']
+        indexes = [
+            # Keyset paging of reviews_list by date and by rating
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['rating', '-created_at', '-id']),
+            # A user's reviews, newest first, on their profile page
+            models.Index(fields=['reviewed_user', '-created_at']),
+        ]
 
     def __str__(self):
         return f"{self.reviewer.username} → {self.reviewed_user.username} ({self.rating}/5)"
 
+
+#--REVIEW STATS--
+class ReviewStats(models.Model):
+    """Single-row, incrementally maintained site-wide review statistics"""
+    total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    five_star_count = models.PositiveIntegerField(default=0)
+    active_reviewers = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "review stats"
+
+    def __str__(self):
+        return f"{self.total_reviews} reviews, {self.active_reviewers} reviewers"
+
+    @classmethod
+    def load(cls):
+        stats, _ = cls.objects.get_or_create(pk=1)
+        return stats
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.total_reviews if self.total_reviews else 0
+
+
+#--BACKGROUND JOB--
+class Job(models.Model):
+    """A unit of deferred work, run by the run_worker command (see jobs.py)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    # Canonical JSON of the handler's keyword arguments, of any length
+    args = models.TextField(default='{}')
+    # SHA-256 of args; with kind, the dedup key (jobs.py sets it)
+    args_hash = models.CharField(max_length=64, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # At most one pending copy of identical work
+            models.UniqueConstraint(
+                fields=['kind', 'args_hash'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_job_hash',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}({self.args}) [{self.status}]"
@@ -0,0 +1,141 @@
+import base64
+import json
+import math
+
+from django.core.cache import cache
+from django.db.models import Q
+
+
+# Seconds a cached page-listing total is reused before it is counted again
+COUNT_CACHE_TTL = 300
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# Cursor integers outside a 64-bit column's range can't be bound as parameters
+_INT_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _comparable(value):
+    """Whether rows can be compared against a decoded cursor value"""
+    if value is None:
+        return False
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, int):
+        return _INT_RANGE[0] <= value <= _INT_RANGE[1]
+    return True
+
+
+def decode_cursor(cursor, fields):
+    """Parse a cursor back into python values for fields; None if it is malformed.
+
+    Tampered values (nulls, NaN, out of range integers) count as malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        return None
+    return values if all(_comparable(value) for value in values) else None
+
+
+def cached_count(queryset, key, timeout=COUNT_CACHE_TTL):
+    """COUNT(*) of queryset, computed at most once per timeout under key"""
+    return cache.get_or_set(f'count:{key}', queryset.count, timeout)
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, iterable like a Django Page"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, total):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset by the values of its ordering instead of OFFSET.
+
+    ordering must end in a unique field (normally 'id' or '-id') so rows with
+    equal sort keys still have a strict order. A page is a range scan that
+    starts right after (or before) the cursor row, so it costs the same at
+    any depth and never counts the table. total is an optional callable for
+    the "N results" label; pass a cached or estimated count, not .count().
+    """
+
+    def __init__(self, queryset, ordering, per_page, total=None):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.fields = [queryset.model._meta.get_field(name) for name, _ in self.ordering]
+        self.per_page = per_page
+        self.total = total
+
+    def _cursor(self, obj):
+        # value_to_string keeps full precision (e.g. datetime microseconds)
+        return encode_cursor([field.value_to_string(obj) for field in self.fields])
+
+    def _beyond(self, values, backwards):
+        """Rows strictly after values in the ordering (before it if backwards)"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def page(self, after=None, before=None, last=False):
+        """The page following cursor after, preceding cursor before, or the last page.
+
+        With no arguments (or an unreadable cursor) returns the first page.
+        """
+        after = decode_cursor(after, self.fields) if after else None
+        before = decode_cursor(before, self.fields) if before else None
+        backwards = bool(before) or (last and not after)
+
+        queryset = self.queryset
+        if backwards:
+            queryset = queryset.reverse()
+            if before:
+                queryset = queryset.filter(self._beyond(before, backwards=True))
+        elif after:
+            queryset = queryset.filter(self._beyond(after, backwards=False))
+
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = more, bool(before)
+        else:
+            has_previous, has_next = bool(after), more
+
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor(rows[-1]) if rows and has_next else None,
+            previous_cursor=self._cursor(rows[0]) if rows and has_previous else None,
+            total=self.total() if self.total else None,
+        )
@@ -0,0 +1,46 @@
+import threading
+import time
+
+
+class ProcessIndex:
+    """Holder of one in-memory index per worker process.
+
+    The index is built on first use and rebuilt once older than ttl seconds,
+    to pick up writes made by other processes; writes made here are applied
+    in place with apply(). Every use of the index goes through the lock.
+
+        _index = ProcessIndex(SomeIndex.build, ttl=300)
+        _index.read(lambda index: index.lookup(...))
+    """
+
+    def __init__(self, build, ttl):
+        self.build = build
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._index = None
+        self._built_at = 0.0
+
+    def get(self):
+        """Return the index, building it on first use or once stale"""
+        with self.lock:
+            if self._index is None or time.monotonic() - self._built_at > self.ttl:
+                self._index = self.build()
+                self._built_at = time.monotonic()
+            return self._index
+
+    def read(self, func):
+        """Call func(index) under the lock and return its result"""
+        index = self.get()
+        with self.lock:
+            return func(index)
+
+    def apply(self, func):
+        """Call func(index) under the lock if the index is built (no-op otherwise)"""
+        with self.lock:
+            if self._index is not None:
+                func(self._index)
+
+    def invalidate(self):
+        """Drop the index so the next use rebuilds it"""
+        with self.lock:
+            self._index = None
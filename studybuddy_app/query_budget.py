@@ -0,0 +1,123 @@
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its view's budget allows, or repeated one too often"""
+
+
+@dataclass(frozen=True)
+class Budget:
+    queries: Optional[int] = None
+    repeats: Optional[int] = None
+
+
+def query_budget(queries=None, repeats=None):
+    """Declare the most queries a view may run per request, and how many times
+    any one SQL shape may repeat (default settings.QUERY_BUDGET_MAX_REPEATS).
+
+    Only records the budget on the view; QueryBudgetMiddleware checks it.
+    """
+    def declare(view):
+        view.query_budget = Budget(queries, repeats)
+        return view
+    return declare
+
+
+def fingerprint(sql):
+    """A query's shape: its SQL with whitespace normalised and IN lists of any length folded"""
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', sql.strip()))
+
+
+class RequestQueries:
+    """Count, SQL time and shapes of the queries one request runs"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, limit):
+        """(shape, times) of every shape run more than limit times, most frequent first"""
+        return [(shape, times) for shape, times in self.shapes.most_common() if times > limit]
+
+
+# The recorder of the request being served; a context variable so it follows
+# async views into the threads sync_to_async runs their queries in
+_current = contextvars.ContextVar('query_budget_recorder', default=None)
+
+
+def _record(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_recorder(sender, connection, **kwargs):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+@contextmanager
+def recording(recorder):
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+def check(request, recorder):
+    """Hold recorder up against the budget of the view that served request.
+
+    Views without @query_budget get settings.QUERY_BUDGET_DEFAULT queries
+    (None: no limit). Logs a warning, or raises QueryBudgetExceeded with
+    settings.QUERY_BUDGET_RAISE.
+    """
+    match = getattr(request, 'resolver_match', None)
+    budget = getattr(match.func, 'query_budget', None) if match else None
+    limit = budget.queries if budget else getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    repeats = getattr(settings, 'QUERY_BUDGET_MAX_REPEATS', 3)
+    if budget and budget.repeats is not None:
+        repeats = budget.repeats
+
+    problems = []
+    if limit is not None and recorder.count > limit:
+        problems.append(f"{recorder.count} queries, budget {limit}")
+    problems += [f"{times}x {shape}" for shape, times in recorder.repeated(repeats)]
+    if not problems:
+        return
+
+    view = match.view_name if match else request.path
+    message = f"{view} ({request.method} {request.path}) over its query budget " \
+              f"[{recorder.duration * 1000:.1f} ms of SQL]: " + '; '.join(problems)
+    if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
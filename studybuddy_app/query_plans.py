@@ -0,0 +1,166 @@
+import json
+import re
+import warnings
+
+from django.db import connection
+
+
+# SQLite: "SCAN studybuddy_app_message" reads the whole table (older versions
+# say "SCAN TABLE ..."); "SCAN ... USING [COVERING] INDEX ..." walks an index
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?$')
+_SQLITE_SEARCH = re.compile(r'^SEARCH (?:TABLE )?"?(\w+)"?(?: AS \w+)?( USING INTEGER PRIMARY KEY| USING PRIMARY KEY)?')
+_SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER|GROUP) BY$')
+_LIMIT = re.compile(r'\sLIMIT\s', re.IGNORECASE)
+
+# Postgres (EXPLAIN (FORMAT JSON)): node types that sort; hashed aggregates are
+# spotted by their "Strategy" instead
+_POSTGRES_SORTS = ('Sort', 'Incremental Sort')
+
+
+class QueryRecorder:
+    """Execute wrapper keeping the SQL and parameters of every query it sees.
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            ...
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class UnsupportedDatabase(NotImplementedError):
+    """The database has no EXPLAIN output this module can read"""
+
+
+def explain(sql, params=None, using=connection):
+    """The plan of one query: EXPLAIN QUERY PLAN lines on SQLite, the root
+    node of EXPLAIN (FORMAT JSON) on Postgres"""
+    with using.cursor() as cursor:
+        if using.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        if using.vendor == 'postgresql':
+            # On small tables a sequential scan is always cheapest; priced out of
+            # the running, one that remains means no index can serve the query
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                output = cursor.fetchone()[0]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+            if isinstance(output, str):
+                output = json.loads(output)
+            return output[0]['Plan']
+    raise UnsupportedDatabase(f"No EXPLAIN support for {using.vendor}")
+
+
+def full_scans(plan, vendor=None, limited=False):
+    """Tables a plan reads from start to end.
+
+    That is a table scan, or an index walked end to end whose order the
+    query throws away by sorting or grouping afterwards. An index walk that
+    delivers rows in the requested order can stop at the LIMIT, so it
+    passes.
+
+    With limited=True (the query is a page: it has a LIMIT) a sort also
+    condemns the index searches under it: they read every matching row,
+    however deep the page, only for the sort to keep a few. Primary key
+    lookups joined in per row are not counted; the search feeding them is.
+    """
+    if (vendor or connection.vendor) == 'postgresql':
+        return _postgres_full_scans(plan, limited)
+    sorts = any(_SQLITE_SORT.search(line) for line in plan)
+    scans = set()
+    for line in plan:
+        line = line.strip()
+        match = _SQLITE_SCAN.match(line)
+        if match and (not match.group(2) or sorts):
+            scans.add(match.group(1))
+        match = _SQLITE_SEARCH.match(line)
+        if match and not match.group(2) and sorts and limited:
+            scans.add(match.group(1))
+    return scans
+
+
+def _postgres_nodes(node):
+    """node and every node below it, depth first"""
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _postgres_nodes(child)
+
+
+def _postgres_full_scans(plan, limited=False):
+    nodes = list(_postgres_nodes(plan))
+    # Without a LIMIT on top, or with a sort in between, every entry is read
+    sorts = any(
+        node['Node Type'] in _POSTGRES_SORTS or node.get('Strategy') == 'Hashed'
+        for node in nodes
+    )
+    reads_everything = plan['Node Type'] != 'Limit' or sorts
+    scans = set()
+    for node in nodes:
+        # Forward or backward ("Scan Direction"), an index scan is the same node type
+        kind = node['Node Type']
+        table = node.get('Relation Name')
+        if kind == 'Seq Scan':
+            scans.add(table)
+        elif kind in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node and reads_everything:
+            scans.add(table)
+        elif (kind.endswith('Scan') and table and limited and sorts
+              and not node.get('Index Name', '').endswith('_pkey')):
+            scans.add(table)
+    return scans
+
+
+def plan_lines(plan, vendor=None):
+    """A plan as text lines, for reports"""
+    if (vendor or connection.vendor) != 'postgresql':
+        return list(plan)
+    lines = []
+
+    def describe(node, depth):
+        parts = [node['Node Type']]
+        if node.get('Scan Direction') == 'Backward':
+            parts.append('Backward')
+        if node.get('Index Name'):
+            parts.append(f"using {node['Index Name']}")
+        if node.get('Relation Name'):
+            parts.append(f"on {node['Relation Name']}")
+        for detail in ('Index Cond', 'Recheck Cond', 'Filter', 'Sort Key'):
+            if detail in node:
+                parts.append(f"[{detail}: {node[detail]}]")
+        lines.append('  ' * depth + ' '.join(parts))
+        for child in node.get('Plans', ()):
+            describe(child, depth + 1)
+
+    describe(plan, 0)
+    return lines
+
+
+def audit(queries, tables, using=connection):
+    """EXPLAIN each (sql, params) pair, as a QueryRecorder collects them.
+
+    Returns (sql, plan lines, scanned tables) for every query that scans one
+    of tables in full, or sorts all its matches to return one page of them.
+    Statements other than reads, updates and deletes are skipped, and so is
+    the whole audit (with a warning) on a database other than SQLite or
+    Postgres.
+    """
+    if using.vendor not in ('sqlite', 'postgresql'):
+        warnings.warn(f"Query plans aren't audited on {using.vendor}", RuntimeWarning, stacklevel=2)
+        return []
+    findings = []
+    for sql, params in queries:
+        if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            continue
+        plan = explain(sql, params, using)
+        scanned = full_scans(plan, using.vendor, limited=bool(_LIMIT.search(sql))) & set(tables)
+        if scanned:
+            findings.append((sql, plan_lines(plan, using.vendor), scanned))
+    return findings
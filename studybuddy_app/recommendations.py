@@ -0,0 +1,294 @@
+import re
+
+import numpy as np
+from django.conf import settings
+
+from .models import Profile, ProfileCourse
+from .process_index import ProcessIndex
+
+
+# Relative weight of each signal in a candidate's score (sums to 1)
+WEIGHTS = {
+    'courses': 0.55,
+    'rating': 0.15,
+    'major': 0.15,
+    'methods': 0.15,
+}
+
+_METHOD_SPLIT = re.compile(r'[,;/\n]+')
+_WHITESPACE = re.compile(r'\s+')
+
+_NO_ROWS = np.zeros(0, dtype=np.int64)
+
+
+def _normalize(value):
+    return (value or '').strip().lower()
+
+
+def _method_tokens(study_methods):
+    """Set of study methods in free text: "Flashcards, group  study" -> {'flashcards', 'group study'}"""
+    tokens = (_WHITESPACE.sub(' ', token).strip() for token in _METHOD_SPLIT.split(_normalize(study_methods)))
+    return {token for token in tokens if token}
+
+
+def _postings(row_sets):
+    """{key: array of rows} from one set of keys per row"""
+    lists = {}
+    for row, keys in enumerate(row_sets):
+        for key in keys:
+            lists.setdefault(key, []).append(row)
+    return {key: np.array(rows, dtype=np.int64) for key, rows in lists.items()}
+
+
+def _move(postings, row, old, new):
+    """Update the posting lists of one row whose keys change from old to new.
+
+    Lists that empty out are dropped, so postings only ever holds keys some
+    row still has.
+    """
+    for key in old - new:
+        rows = postings[key][postings[key] != row]
+        if len(rows):
+            postings[key] = rows
+        else:
+            del postings[key]
+    for key in new - old:
+        postings[key] = np.append(postings.get(key, _NO_ROWS), row)
+
+
+def _overlap(postings, keys, rows, size):
+    """For each of rows, how many of keys it has too"""
+    if not keys:
+        return np.zeros(len(rows))
+    hits = np.concatenate([postings[key] for key in keys])
+    return np.bincount(hits, minlength=size)[rows].astype(np.float64)
+
+
+class BuddyIndex:
+    """In-memory profile×course incidence matrix used to rank study buddies.
+
+    The matrix is stored column-wise as one array of profile rows per course,
+    so scoring a profile touches only the rosters of its own courses. Study
+    methods are kept the same way, one array of rows per normalised method,
+    and compared as exact token sets. Per-row arrays hold rating and major.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self.ratings = np.zeros(0, dtype=np.float64)
+        self.majors = np.zeros(0, dtype=np.int64)
+        self.course_counts = np.zeros(0, dtype=np.float64)
+        self.row_courses = []
+        self.postings = {}
+        self.method_counts = np.zeros(0, dtype=np.float64)
+        self.row_methods = []
+        self.method_postings = {}
+        self._majors = {}
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        profiles = list(Profile.objects.values_list('id', 'rating', 'major', 'study_methods'))
+        n = len(profiles)
+        index.ids = np.fromiter((p[0] for p in profiles), dtype=np.int64, count=n)
+        index.active = np.ones(n, dtype=bool)
+        index.ratings = np.fromiter((p[1] or 0.0 for p in profiles), dtype=np.float64, count=n)
+        index.majors = np.fromiter((index._major_code(p[2]) for p in profiles), dtype=np.int64, count=n)
+        index.row_methods = [_method_tokens(p[3]) for p in profiles]
+        index.method_postings = _postings(index.row_methods)
+        index.method_counts = np.fromiter((len(m) for m in index.row_methods), dtype=np.float64, count=n)
+        index.rows = {profile_id: row for row, profile_id in enumerate(index.ids.tolist())}
+        index.row_courses = [set() for _ in range(n)]
+
+        for profile_id, course_id in ProfileCourse.objects.values_list('profile_id', 'course_id'):
+            row = index.rows.get(profile_id)
+            if row is not None:
+                index.row_courses[row].add(course_id)
+        index.postings = _postings(index.row_courses)
+        index.course_counts = np.fromiter((len(c) for c in index.row_courses), dtype=np.float64, count=n)
+        return index
+
+    def _major_code(self, major):
+        major = _normalize(major)
+        if not major:
+            return 0
+        return self._majors.setdefault(major, len(self._majors) + 1)
+
+    def _append_row(self, profile_id):
+        row = len(self.ids)
+        self.rows[profile_id] = row
+        self.ids = np.append(self.ids, profile_id)
+        self.active = np.append(self.active, False)
+        self.ratings = np.append(self.ratings, 0.0)
+        self.majors = np.append(self.majors, 0)
+        self.course_counts = np.append(self.course_counts, 0.0)
+        self.row_courses.append(set())
+        self.method_counts = np.append(self.method_counts, 0.0)
+        self.row_methods.append(set())
+        return row
+
+    def _set_courses(self, row, course_ids):
+        _move(self.postings, row, self.row_courses[row], course_ids)
+        self.row_courses[row] = set(course_ids)
+        self.course_counts[row] = len(course_ids)
+
+    def _set_methods(self, row, methods):
+        _move(self.method_postings, row, self.row_methods[row], methods)
+        self.row_methods[row] = methods
+        self.method_counts[row] = len(methods)
+
+    def put_profile(self, profile_id, rating, major, study_methods):
+        """Add or update a profile's row; its courses are left as they are"""
+        row = self.rows.get(profile_id)
+        if row is None:
+            row = self._append_row(profile_id)
+        self.active[row] = True
+        self.ratings[row] = rating or 0.0
+        self.majors[row] = self._major_code(major)
+        self._set_methods(row, _method_tokens(study_methods))
+
+    def drop_profile(self, profile_id):
+        row = self.rows.get(profile_id)
+        if row is not None:
+            self.active[row] = False
+            self._set_courses(row, set())
+            self._set_methods(row, set())
+
+    def change_courses(self, profile_id, added=(), removed=()):
+        """Add and remove course memberships of one profile (removed=None: all of them)"""
+        row = self.rows.get(profile_id)
+        if row is None:
+            row = self._append_row(profile_id)
+            self.active[row] = True
+        kept = set() if removed is None else self.row_courses[row] - set(removed)
+        self._set_courses(row, kept | set(added))
+
+    def _shared(self, row):
+        """Rows of the other active profiles sharing a course with row, and how many they share"""
+        if not self.row_courses[row]:
+            return _NO_ROWS, _NO_ROWS
+        hits = np.concatenate([self.postings[c] for c in self.row_courses[row]])
+        shared = np.bincount(hits, minlength=len(self.ids))
+        shared[row] = 0
+        shared[~self.active] = 0
+        candidates = np.flatnonzero(shared)
+        return candidates, shared[candidates]
+
+    def _candidates(self, row, allowed=None):
+        """_shared(row), narrowed down to the profile ids in allowed (an array) if given"""
+        candidates, shared = self._shared(row)
+        if allowed is not None and len(candidates):
+            keep = np.isin(self.ids[candidates], allowed)
+            candidates, shared = candidates[keep], shared[keep]
+        return candidates, shared
+
+    def count(self, profile_id, allowed=None):
+        """How many profiles share a course with profile_id (of those in allowed)"""
+        row = self.rows.get(profile_id)
+        return 0 if row is None else len(self._candidates(row, allowed)[0])
+
+    def scores(self, profile_id, allowed=None):
+        """Score every profile sharing a course with profile_id (of those in allowed).
+
+        Returns (candidate profile ids, scores, shared course counts).
+        """
+        row = self.rows.get(profile_id)
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64))
+        if row is None:
+            return empty
+        candidates, shared = self._candidates(row, allowed)
+        if not len(candidates):
+            return empty
+
+        overlap = shared.astype(np.float64)
+        jaccard = overlap / (self.course_counts[row] + self.course_counts[candidates] - overlap)
+
+        same_major = (self.majors[candidates] == self.majors[row]) & (self.majors[row] != 0)
+
+        common = _overlap(self.method_postings, self.row_methods[row], candidates, len(self.ids))
+        union = self.method_counts[row] + self.method_counts[candidates] - common
+        methods = np.divide(common, union, out=np.zeros(len(candidates)), where=union > 0)
+
+        score = (
+            WEIGHTS['courses'] * jaccard
+            + WEIGHTS['rating'] * self.ratings[candidates] / 5.0
+            + WEIGHTS['major'] * same_major
+            + WEIGHTS['methods'] * methods
+        )
+        return self.ids[candidates], score, shared
+
+    def top(self, profile_id, offset=0, limit=20, allowed=None):
+        """Return (ranked [(profile_id, score, shared)] slice, total candidates)"""
+        ids, score, shared = self.scores(profile_id, allowed)
+        total = len(ids)
+        k = min(offset + limit, total)
+        if k <= 0:
+            return [], total
+        if k < total:
+            # Everything scoring at least the k-th best, ties included: which of
+            # several equal scores argpartition keeps is arbitrary, and pages cut
+            # from different k must agree on the id tie-break
+            kth = np.partition(-score, k - 1)[k - 1]
+            best = np.flatnonzero(-score <= kth)
+        else:
+            best = np.arange(total)
+        # Highest score first; lower profile id breaks ties so pages are stable
+        best = best[np.lexsort((ids[best], -score[best]))][offset:k]
+        return list(zip(ids[best].tolist(), score[best].tolist(), shared[best].tolist())), total
+
+
+_index = ProcessIndex(BuddyIndex.build, ttl=getattr(settings, 'BUDDY_INDEX_TTL', 300))
+invalidate = _index.invalidate
+
+
+def profile_saved(profile):
+    _index.apply(lambda index: index.put_profile(profile.id, profile.rating, profile.major, profile.study_methods))
+
+
+def profile_deleted(profile_id):
+    _index.apply(lambda index: index.drop_profile(profile_id))
+
+
+def courses_changed(changes):
+    """Apply {profile_id: (added course ids, removed course ids or None for all)}
+    to an already built index (no-op otherwise)"""
+    def change(index):
+        for profile_id, (added, removed) in changes.items():
+            index.change_courses(profile_id, added, removed)
+    _index.apply(change)
+
+
+def _ids(allowed):
+    # A set of profile ids (e.g. from a CourseFilter) as the array np.isin wants
+    return None if allowed is None else np.fromiter(allowed, dtype=np.int64, count=len(allowed))
+
+
+def recommend(profile, offset=0, limit=20, allowed=None):
+    """Top-ranked study buddies for profile: ([(profile_id, score, shared)], total).
+
+    allowed (a set of profile ids) narrows them down before ranking.
+    """
+    allowed = _ids(allowed)
+    return _index.read(lambda index: index.top(profile.id, offset=offset, limit=limit, allowed=allowed))
+
+
+class Ranking:
+    """A profile's ranked buddies as a sequence of (profile_id, score, shared), for a
+    Paginator: its length is a count, and only the slice taken for a page is sorted"""
+
+    def __init__(self, profile, allowed=None):
+        self.profile = profile
+        self.allowed = allowed
+
+    def __len__(self):
+        allowed = _ids(self.allowed)
+        return _index.read(lambda index: index.count(self.profile.id, allowed))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError("Ranking only supports contiguous slices")
+        start = item.start or 0
+        stop = len(self) if item.stop is None else item.stop
+        return recommend(self.profile, offset=start, limit=max(stop - start, 0), allowed=self.allowed)[0]
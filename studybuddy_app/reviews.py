@@ -0,0 +1,99 @@
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import Profile, Review, ReviewStats
+
+
+def apply_review_delta(user_id, count_delta, sum_delta):
+    """Shift a reviewed user's Profile aggregates in one UPDATE.
+
+    The new rating is computed from the pre-update columns inside the same
+    statement, so concurrent reviews can't leave it out of step.
+    """
+    if not count_delta and not sum_delta:
+        return
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    Profile.objects.filter(user_id=user_id).update(
+        review_count=new_count,
+        rating_sum=new_sum,
+        rating=Case(
+            When(review_count__gt=-count_delta, then=Cast(new_sum, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def review_aggregates():
+    """{reviewed_user_id: (review_count, rating_sum)} straight from Review"""
+    rows = (
+        Review.objects
+        .order_by()
+        .values('reviewed_user_id')
+        .annotate(count=Count('id'), total=Sum('rating'))
+    )
+    return {row['reviewed_user_id']: (row['count'], row['total'] or 0) for row in rows}
+
+
+def sync_profile_aggregates(dry_run=False):
+    """Recompute every Profile's review aggregates; returns the number that were off"""
+    aggregates = review_aggregates()
+    stale = []
+    for profile in Profile.objects.only('id', 'user_id', 'review_count', 'rating_sum', 'rating'):
+        count, total = aggregates.get(profile.user_id, (0, 0))
+        rating = total / count if count else 0.0
+        if (profile.review_count, profile.rating_sum, profile.rating) != (count, total, rating):
+            profile.review_count, profile.rating_sum, profile.rating = count, total, rating
+            stale.append(profile)
+    if stale and not dry_run:
+        Profile.objects.bulk_update(stale, ['review_count', 'rating_sum', 'rating'], batch_size=1000)
+    return len(stale)
+
+
+def apply_site_delta(total=0, rating_sum=0, five_star=0, reviewers=0):
+    """Shift the site-wide ReviewStats row in one UPDATE"""
+    if not (total or rating_sum or five_star or reviewers):
+        return
+    ReviewStats.load()
+    ReviewStats.objects.filter(pk=1).update(
+        total_reviews=F('total_reviews') + total,
+        rating_sum=F('rating_sum') + rating_sum,
+        five_star_count=F('five_star_count') + five_star,
+        active_reviewers=F('active_reviewers') + reviewers,
+    )
+
+
+def review_changed(previous_rating, rating):
+    apply_site_delta(0, rating - previous_rating, int(rating == 5) - int(previous_rating == 5), 0)
+
+
+def review_added(reviewer_id, rating):
+    # Called after the insert, so a first-time reviewer now has exactly one review
+    first_review = not Review.objects.filter(reviewer_id=reviewer_id)[1:2].exists()
+    apply_site_delta(1, rating, int(rating == 5), int(first_review))
+
+
+def review_removed(reviewer_id, rating):
+    last_review = not Review.objects.filter(reviewer_id=reviewer_id).exists()
+    apply_site_delta(-1, -rating, -int(rating == 5), -int(last_review))
+
+
+def site_aggregates():
+    stats = Review.objects.aggregate(
+        total_reviews=Count('id'),
+        rating_sum=Sum('rating'),
+        five_star_count=Count('id', filter=Q(rating=5)),
+        active_reviewers=Count('reviewer', distinct=True),
+    )
+    return {field: value or 0 for field, value in stats.items()}
+
+
+def sync_site_stats(dry_run=False):
+    """Recompute ReviewStats from Review; returns True if it had drifted"""
+    stats = ReviewStats.load()
+    fresh = site_aggregates()
+    drifted = any(getattr(stats, field) != value for field, value in fresh.items())
+    if drifted and not dry_run:
+        ReviewStats.objects.filter(pk=stats.pk).update(**fresh)
+    return drifted
@@ -0,0 +1,92 @@
+import re
+
+from django.db import connection
+
+from .models import Profile, ProfileSearch
+
+
+FTS_TABLE = 'studybuddy_app_profilesearch_fts'
+
+# Cap on ranked hits; deeper pages of a free-text search are never read
+MAX_RESULTS = 500
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def document_text(username, fname, lname, major, study_methods, bio, courses):
+    """Flatten the searchable parts of a profile into one document.
+
+    courses is an iterable of (code, name) pairs.
+    """
+    parts = [username, fname, lname, major, study_methods, bio]
+    for code, name in courses:
+        parts += [code, name]
+    return '\n'.join(part for part in parts if part)
+
+
+def refresh_documents(profile_ids):
+    """Rebuild the search documents of the given profiles (a few queries total)"""
+    profiles = (
+        Profile.objects
+        .filter(id__in=list(profile_ids))
+        .select_related('user')
+        .prefetch_related('courses')
+    )
+    rows = [
+        ProfileSearch(profile=profile, document=document_text(
+            profile.user.username, profile.fname, profile.lname, profile.major,
+            profile.study_methods, profile.bio,
+            [(course.code, course.name) for course in profile.courses.all()],
+        ))
+        for profile in profiles
+    ]
+    if rows:
+        ProfileSearch.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['profile'], update_fields=['document'],
+        )
+    return len(rows)
+
+
+def _tokens(query):
+    return _TOKEN.findall(query.lower())
+
+
+def _ranked_ids_sqlite(tokens, limit):
+    # Each token as a quoted prefix term, all required; bm25 is lower-is-better
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _ranked_ids_postgresql(tokens, limit):
+    query = ' & '.join(f'{token}:*' for token in tokens)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT profile_id FROM studybuddy_app_profilesearch, to_tsquery('simple', %s) query "
+            "WHERE vector @@ query ORDER BY ts_rank(vector, query) DESC, profile_id LIMIT %s",
+            [query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _ranked_ids_fallback(tokens, limit):
+    documents = ProfileSearch.objects.all()
+    for token in tokens:
+        documents = documents.filter(document__icontains=token)
+    return list(documents.values_list('profile_id', flat=True)[:limit])
+
+
+def search_profile_ids(query, limit=MAX_RESULTS):
+    """Ids of profiles matching every word of query, most relevant first"""
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    backend = {
+        'sqlite': _ranked_ids_sqlite,
+        'postgresql': _ranked_ids_postgresql,
+    }.get(connection.vendor, _ranked_ids_fallback)
+    return backend(tokens, limit)
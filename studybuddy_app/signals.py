@@ -0,0 +1,265 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import catalog, course_bitmaps, fragments, images, jobs, recommendations, reviews, typeahead
+from .models import Course, Profile, Review
+
+
+@receiver(m2m_changed, sender=Profile.courses.through)
+def sync_matches_on_course_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Queue the change to the Match rows of whoever's courses changed.
+
+    Forward changes (profile.courses.add/remove/set/clear) are queued per
+    profile, reverse ones (course.students...) per course; clear removes
+    every course or student that is gone by the time the job runs.
+    """
+    if action in ('post_add', 'post_remove') and pk_set:
+        ids = sorted(pk_set)
+        change = {'added': ids, 'removed': []} if action == 'post_add' else {'added': [], 'removed': ids}
+    elif action == 'post_clear':
+        change = {'added': [], 'removed': None}
+    else:
+        return
+    if reverse:
+        jobs.enqueue('course_students', course_id=instance.pk, **change)
+    else:
+        jobs.enqueue('profile_courses', profile_id=instance.pk, **change)
+
+
+@receiver(m2m_changed, sender=Profile.courses.through)
+def update_indexes_on_course_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Apply membership changes to the in-memory buddy index and course bitmaps.
+
+    The signal names what was added or removed, so both indexes are updated
+    from it without reading anyone's course set back.
+    """
+    if action in ('post_add', 'post_remove') and pk_set:
+        course_ids = {instance.pk} if reverse else set(pk_set)
+        change = (course_ids, ()) if action == 'post_add' else ((), course_ids)
+        changes = dict.fromkeys(pk_set if reverse else [instance.pk], change)
+    elif action == 'post_clear':
+        if reverse:
+            # The cleared roster is gone by now; rebuild rather than guess
+            recommendations.invalidate()
+            course_bitmaps.invalidate()
+            return
+        changes = {instance.pk: ((), None)}
+    else:
+        return
+    recommendations.courses_changed(changes)
+    course_bitmaps.courses_changed(changes)
+
+
+@receiver(post_save, sender=Profile)
+def update_indexes_on_profile_save(sender, instance, **kwargs):
+    recommendations.profile_saved(instance)
+    course_bitmaps.profile_saved(instance)
+
+
+@receiver(post_delete, sender=Profile)
+def update_indexes_on_profile_delete(sender, instance, **kwargs):
+    recommendations.profile_deleted(instance.pk)
+    course_bitmaps.profile_deleted(instance.pk)
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # From __dict__: reading a deferred username here would cost a query per instance
+    instance._saved_username = instance.__dict__.get('username')
+
+
+@receiver(pre_save, sender=User)
+def note_username_change(sender, instance, **kwargs):
+    instance._username_changed = instance.username != instance._saved_username
+    instance._saved_username = instance.username
+
+
+def username_changed(user):
+    """Whether the save being handled changed the username, the only User field
+    profiles show; every login saves the User just to set last_login"""
+    return getattr(user, '_username_changed', True)
+
+
+def refresh_search_later(profile_ids):
+    jobs.enqueue_many('refresh_search', [{'profile_id': profile_id} for profile_id in profile_ids])
+
+
+@receiver(post_save, sender=Profile)
+def refresh_search_on_profile_save(sender, instance, **kwargs):
+    refresh_search_later([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def refresh_search_on_user_save(sender, instance, created, **kwargs):
+    if not created and username_changed(instance):
+        refresh_search_later(Profile.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Course)
+def refresh_search_on_course_save(sender, instance, created, **kwargs):
+    if not created:
+        refresh_search_later(instance.students.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Course)
+def remember_roster_before_course_delete(sender, instance, **kwargs):
+    # Memberships are cascaded away without an m2m_changed signal
+    instance._search_roster = list(instance.students.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Course)
+def refresh_search_on_course_delete(sender, instance, **kwargs):
+    refresh_search_later(getattr(instance, '_search_roster', []))
+
+
+@receiver(m2m_changed, sender=Profile.courses.through)
+def refresh_search_on_course_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Queue rebuilds of search documents of profiles whose course list changed"""
+    if action == 'pre_clear' and reverse:
+        # Remember the roster; it is gone by post_clear
+        instance._search_roster = list(instance.students.values_list('id', flat=True))
+    elif action == 'post_clear':
+        refresh_search_later(getattr(instance, '_search_roster', []) if reverse else [instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        refresh_search_later(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_catalog_on_course_change(sender, instance, **kwargs):
+    # After commit: a reader in between would cache the old catalog again
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver(post_save, sender=Course)
+def refresh_typeahead_on_course_save(sender, instance, **kwargs):
+    typeahead.course_saved(instance)
+
+
+@receiver(post_delete, sender=Course)
+def refresh_typeahead_on_course_delete(sender, instance, **kwargs):
+    typeahead.course_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def refresh_typeahead_on_profile_save(sender, instance, **kwargs):
+    typeahead.profile_saved(instance)
+
+
+@receiver(post_delete, sender=Profile)
+def refresh_typeahead_on_profile_delete(sender, instance, **kwargs):
+    typeahead.profile_deleted(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def refresh_typeahead_on_user_save(sender, instance, created, **kwargs):
+    if not created and username_changed(instance):
+        profile = Profile.objects.filter(user=instance).first()
+        if profile is not None:
+            typeahead.profile_saved(profile)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_before_save(sender, instance, **kwargs):
+    instance._previous = (
+        Review.objects.filter(pk=instance.pk).values_list('reviewed_user_id', 'rating', 'reviewer_id').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_review_aggregates_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        reviews.apply_review_delta(previous[0], -1, -previous[1])
+    reviews.apply_review_delta(instance.reviewed_user_id, 1, instance.rating)
+
+    if previous is None:
+        reviews.review_added(instance.reviewer_id, instance.rating)
+    elif previous[2] != instance.reviewer_id:
+        reviews.review_removed(previous[2], previous[1])
+        reviews.review_added(instance.reviewer_id, instance.rating)
+    else:
+        reviews.review_changed(previous[1], instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_review_aggregates_on_delete(sender, instance, **kwargs):
+    reviews.apply_review_delta(instance.reviewed_user_id, -1, -instance.rating)
+    reviews.review_removed(instance.reviewer_id, instance.rating)
+
+
+@receiver(post_save, sender=Profile)
+def bump_fragments_on_profile_save(sender, instance, **kwargs):
+    fragments.bump_later([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def bump_fragments_on_user_save(sender, instance, created, **kwargs):
+    if not created and username_changed(instance):
+        fragments.bump_users_later([instance.pk])
+
+
+@receiver(m2m_changed, sender=Profile.courses.through)
+def bump_fragments_on_course_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._fragment_roster = list(instance.students.values_list('id', flat=True))
+    elif action == 'post_clear':
+        fragments.bump_later(getattr(instance, '_fragment_roster', []) if reverse else [instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        fragments.bump_later(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Course)
+def bump_fragments_on_course_save(sender, instance, created, **kwargs):
+    if not created:
+        fragments.bump_later(instance.students.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Course)
+def bump_fragments_on_course_delete(sender, instance, **kwargs):
+    # Memberships are cascaded away without an m2m_changed signal
+    fragments.bump_later(instance.students.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_fragments_on_review_change(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    user_ids = {instance.reviewed_user_id}
+    if previous is not None:
+        user_ids.add(previous[0])
+    fragments.bump_users_later(user_ids)
+
+
+@receiver(pre_save, sender=Profile)
+def remember_picture_before_save(sender, instance, **kwargs):
+    previous, variants = (
+        Profile.objects.filter(pk=instance.pk).values_list('picture', 'picture_variants').first() or ('', '')
+        if instance.pk else ('', '')
+    )
+    instance._previous_picture = previous or ''
+    if instance._previous_picture == (instance.picture.name or ''):
+        # Don't let a copy loaded before the variants job finished write back a stale value
+        instance.picture_variants = variants
+
+
+@receiver(post_save, sender=Profile)
+def generate_picture_variants(sender, instance, **kwargs):
+    """Queue thumbnails of a newly uploaded picture; drop the old picture's"""
+    previous = getattr(instance, '_previous_picture', '')
+    current = instance.picture.name or ''
+    if previous == current:
+        return
+    if previous:
+        images.delete_variants(previous, instance.picture.storage)
+    if current:
+        jobs.enqueue('picture_variants', profile_id=instance.pk)
+
+
+@receiver(post_delete, sender=Profile)
+def delete_picture_variants(sender, instance, **kwargs):
+    if instance.picture:
+        images.delete_variants(instance.picture.name, instance.picture.storage)
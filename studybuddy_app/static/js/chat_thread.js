@@ -4,27 +4,207 @@ document.addEventListener('DOMContentLoaded', function () {
     const sendBtn = document.getElementById('sendBtn');
     const messageForm = document.getElementById('messageForm');
     const messagesContainer = document.getElementById('messagesContainer');
+    const historyUrl = messagesContainer.dataset.historyUrl;
+    let nextCursor = messagesContainer.dataset.nextCursor;
+    // Newest message id the partner has read; sent messages up to it show as seen
+    let partnerRead = Number(messagesContainer.dataset.partnerRead) || 0;
+    let loadingHistory = false;
+    const pendingMessages = new Map();
+    let socket = null;
+    let polling = false;
 
     function scrollToBottom() {
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
     }
 
-    function addMessageToChat(content, isSent, status = '') {
+    function buildMessage(content, isSent, time, status = '') {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${isSent ? 'sent' : 'received'}`;
-        messageDiv.innerHTML = `
-            <div class="message-bubble">
-                ${content}
-                <div class="message-time">Just now</div>
-                ${isSent ? `<div class="message-status">${status}</div>` : ''}
-            </div>
-        `;
+
+        const bubble = document.createElement('div');
+        bubble.className = 'message-bubble';
+        bubble.appendChild(document.createTextNode(content));
+
+        const timeDiv = document.createElement('div');
+        timeDiv.className = 'message-time';
+        timeDiv.textContent = time;
+        bubble.appendChild(timeDiv);
+
+        if (isSent) {
+            const statusDiv = document.createElement('div');
+            statusDiv.className = 'message-status';
+            statusDiv.innerHTML = status;
+            bubble.appendChild(statusDiv);
+        }
+
+        messageDiv.appendChild(bubble);
+        return messageDiv;
+    }
+
+    function sentStatus(id) {
+        return id <= partnerRead
+            ? '<i class="bi bi-eye"></i> Seen'
+            : '<i class="bi bi-check2-all"></i> Delivered';
+    }
+
+    function markSeen(upTo) {
+        if (!(upTo > partnerRead)) return;
+        partnerRead = upTo;
+        messagesContainer.querySelectorAll('.message.sent[data-id]').forEach(function (el) {
+            if (Number(el.dataset.id) <= partnerRead) {
+                el.querySelector('.message-status').innerHTML = sentStatus(Number(el.dataset.id));
+            }
+        });
+    }
+
+    function hasMessage(id) {
+        return messagesContainer.querySelector(`.message[data-id="${id}"]`) !== null;
+    }
+
+    function markDelivered(messageDiv, id) {
+        if (hasMessage(id)) {
+            // The socket push beat the HTTP response; keep a single copy
+            messageDiv.remove();
+            return;
+        }
+        messageDiv.dataset.id = id;
+        messageDiv.querySelector('.message-status').innerHTML = sentStatus(id);
+    }
+
+    function addMessageToChat(content, isSent, status = '') {
+        const messageDiv = buildMessage(content, isSent, 'Just now', status);
         const emptyState = messagesContainer.querySelector('.empty-state');
         if (emptyState) emptyState.remove();
         messagesContainer.appendChild(messageDiv);
         scrollToBottom();
+        return messageDiv;
     }
 
+    // Fetch the next older page and prepend it, keeping the viewport in place
+    async function loadOlderMessages() {
+        if (!nextCursor || loadingHistory) return;
+        loadingHistory = true;
+
+        try {
+            const url = `${historyUrl}?${new URLSearchParams({ before: nextCursor })}`;
+            const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+            if (!response.ok) throw new Error('Server error');
+            const data = await response.json();
+
+            const previousHeight = messagesContainer.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            data.messages.forEach(function (message) {
+                const status = message.sent ? sentStatus(message.id) : '';
+                const messageDiv = buildMessage(message.content, message.sent, `${message.timesince} ago`, status);
+                messageDiv.dataset.id = message.id;
+                fragment.appendChild(messageDiv);
+            });
+            messagesContainer.insertBefore(fragment, messagesContainer.firstChild);
+            messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+
+            nextCursor = data.next_cursor;
+        } catch (err) {
+            console.error('Could not load older messages:', err);
+        } finally {
+            loadingHistory = false;
+        }
+    }
+
+    // Live delivery: the server pushes every new message in this thread
+    function connectSocket() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        socket = new WebSocket(`${scheme}://${window.location.host}${messagesContainer.dataset.socketPath}`);
+
+        socket.addEventListener('message', function (event) {
+            const data = JSON.parse(event.data);
+            if (data.read !== undefined) {
+                markSeen(data.read);
+                return;
+            }
+            if (data.error) {
+                const pending = pendingMessages.get(data.client_id);
+                if (pending) pending.querySelector('.message-status').textContent = 'Not sent';
+                pendingMessages.delete(data.client_id);
+                return;
+            }
+
+            const message = data.message;
+            const pending = pendingMessages.get(data.client_id);
+            if (pending) {
+                pendingMessages.delete(data.client_id);
+                markDelivered(pending, message.id);
+                return;
+            }
+            if (hasMessage(message.id)) return;
+
+            const status = message.sent ? sentStatus(message.id) : '';
+            const messageDiv = addMessageToChat(message.content, message.sent, status);
+            messageDiv.dataset.id = message.id;
+        });
+
+        socket.addEventListener('close', function () {
+            socket = null;
+            pollSince();
+            setTimeout(connectSocket, 3000);
+        });
+    }
+
+    function lastMessageId() {
+        let last = 0;
+        messagesContainer.querySelectorAll('.message[data-id]').forEach(function (el) {
+            last = Math.max(last, Number(el.dataset.id));
+        });
+        return last;
+    }
+
+    function delay(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    // Fallback while no socket is open: long-poll for messages newer than the last one shown
+    async function pollSince() {
+        if (polling) return;
+        polling = true;
+
+        while (!socket || socket.readyState !== WebSocket.OPEN) {
+            try {
+                const params = new URLSearchParams({ after: lastMessageId(), wait: 25 });
+                const response = await fetch(`${messagesContainer.dataset.sinceUrl}?${params}`, {
+                    headers: { 'Accept': 'application/json' }
+                });
+                if (response.status === 200) {
+                    const data = await response.json();
+                    data.messages.forEach(function (message) {
+                        if (hasMessage(message.id)) return;
+                        const status = message.sent ? sentStatus(message.id) : '';
+                        const messageDiv = addMessageToChat(message.content, message.sent, status);
+                        messageDiv.dataset.id = message.id;
+                    });
+                    markSeen(data.partner_read);
+                } else if (response.status !== 304) {
+                    await delay(5000);
+                }
+            } catch (err) {
+                console.error('Polling failed:', err);
+                await delay(5000);
+            }
+        }
+
+        polling = false;
+    }
+
+    if ('WebSocket' in window) {
+        connectSocket();
+    } else {
+        pollSince();
+    }
+
+    messagesContainer.addEventListener('scroll', function () {
+        if (messagesContainer.scrollTop < 80) {
+            loadOlderMessages();
+        }
+    });
+
     // Input listener
     messageInput.addEventListener('input', function () {
         this.style.height = 'auto';
@@ -48,7 +228,19 @@ document.addEventListener('DOMContentLoaded', function () {
         sendBtn.innerHTML = '<i class="bi bi-hourglass-split"></i>';
 
         // Optimistic add
-        addMessageToChat(content, true, 'Sending...');
+        const pending = addMessageToChat(content, true, 'Sending...');
+        const status = pending.querySelector('.message-status');
+        const clientId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        pendingMessages.set(clientId, pending);
+
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ content, client_id: clientId }));
+            sendBtn.disabled = false;
+            sendBtn.classList.remove('sending');
+            sendBtn.innerHTML = '<i class="bi bi-send-fill"></i>';
+            resetInput();
+            return;
+        }
 
         try {
             const response = await fetch(window.location.href, {
@@ -56,30 +248,40 @@ document.addEventListener('DOMContentLoaded', function () {
                 headers: {
                     'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
                     'Content-Type': 'application/x-www-form-urlencoded',
+                    'Accept': 'application/json',
                 },
-                body: new URLSearchParams({ content })
+                body: new URLSearchParams({ content, client_id: clientId })
             });
 
             if (response.ok) {
-                location.reload(); // Refresh to load updated messages from DB
+                const data = await response.json();
+                if (pendingMessages.delete(clientId)) {
+                    markDelivered(pending, data.message.id);
+                }
+                sendBtn.innerHTML = '<i class="bi bi-send-fill"></i>';
             } else {
                 console.error('Server error');
+                status.textContent = 'Not sent';
                 sendBtn.innerHTML = '<i class="bi bi-exclamation-triangle-fill"></i>';
             }
         } catch (err) {
             console.error('Network error:', err);
+            status.textContent = 'Not sent';
             sendBtn.innerHTML = '<i class="bi bi-exclamation-triangle-fill"></i>';
         } finally {
             sendBtn.disabled = false;
             sendBtn.classList.remove('sending');
         }
 
-        // Reset input
+        resetInput();
+    });
+
+    function resetInput() {
         messageInput.value = '';
         messageInput.style.height = 'auto';
         charCounter.textContent = '0/500';
         charCounter.classList.remove('warning');
-    });
+    }
 
     // Enter key handling
     messageInput.addEventListener('keydown', function (e) {
@@ -0,0 +1,35 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const searchInput = document.getElementById('searchInput');
+    const suggestionList = document.getElementById('searchSuggestions');
+    if (!searchInput || !suggestionList) return;
+
+    let lastQuery = '';
+
+    // Suggestions come from an in-memory index, so asking on every keystroke is cheap
+    searchInput.addEventListener('input', async function () {
+        const query = this.value.trim();
+        if (query === lastQuery) return;
+        lastQuery = query;
+
+        if (!query) {
+            suggestionList.replaceChildren();
+            return;
+        }
+
+        try {
+            const url = `${searchInput.dataset.suggestUrl}?${new URLSearchParams({ q: query })}`;
+            const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+            if (!response.ok || query !== lastQuery) return;
+            const data = await response.json();
+
+            suggestionList.replaceChildren(...data.suggestions.map(function (suggestion) {
+                const option = document.createElement('option');
+                option.value = suggestion.value;
+                option.label = `${suggestion.label} (${suggestion.type})`;
+                return option;
+            }));
+        } catch (err) {
+            console.error('Suggestions failed:', err);
+        }
+    });
+});
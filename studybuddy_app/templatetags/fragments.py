@@ -0,0 +1,42 @@
+from django import template
+from django.core.cache import cache
+
+from .. import fragments
+
+register = template.Library()
+
+
+class ProfileCacheNode(template.Node):
+    def __init__(self, nodelist, name, profile):
+        self.nodelist = nodelist
+        self.name = name
+        self.profile = profile
+
+    def render(self, context):
+        profile = self.profile.resolve(context)
+        key = fragments.fragment_key(self.name, profile.pk, profile.has_picture_variants)
+        html = cache.get(key)
+        fragments.record(self.name, hit=html is not None)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, fragments.FRAGMENT_TTL)
+        return html
+
+
+@register.tag
+def profilecache(parser, token):
+    """Cache the enclosed markup per profile until the profile changes.
+
+    Usage: {% profilecache 'list_card' profile %} ... {% endprofilecache %}
+    The fragment is keyed on the profile's version stamp (see fragments.py),
+    so it must only depend on that profile, not on the viewer.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and a profile")
+    name = bits[1].strip('\'"')
+    if name not in fragments.FRAGMENTS:
+        raise template.TemplateSyntaxError(f"Unknown profile fragment {name!r}")
+    nodelist = parser.parse(('endprofilecache',))
+    parser.delete_first_token()
+    return ProfileCacheNode(nodelist, name, parser.compile_filter(bits[2]))
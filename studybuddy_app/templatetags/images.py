@@ -0,0 +1,43 @@
+from django import template
+from django.utils.html import format_html
+
+from ..images import SIZES, variant_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture_url(profile, size='small', ext='webp'):
+    """URL of one pre-generated variant of profile's picture ('' without a picture).
+
+    The original picture's URL until the variants have been generated.
+    """
+    if size not in SIZES:
+        raise template.TemplateSyntaxError(f"Unknown picture size {size!r}")
+    if not profile.picture:
+        return ''
+    if not profile.has_picture_variants:
+        return profile.picture.url
+    return profile.picture.storage.url(variant_name(profile.picture.name, size, ext))
+
+
+@register.simple_tag
+def profile_picture(profile, size='small'):
+    """<picture> with the WebP variant and a JPEG fallback, or '' without a picture.
+
+    Usage: {% profile_picture profile 'small' %}
+    """
+    if not profile.picture:
+        return ''
+    if not profile.has_picture_variants:
+        return format_html(
+            '<img src="{}" alt="{}" loading="lazy" decoding="async">',
+            profile.picture.url,
+            profile.user.username,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        picture_url(profile, size, 'webp'),
+        picture_url(profile, size, 'jpg'),
+        profile.user.username,
+    )
@@ -1,3 +1,1191 @@
-from django.test import TestCase
+import asyncio
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from PIL import Image
+
+from . import catalog, course_bitmaps, featured, fragments, jobs, query_plans, recommendations, reviews, typeahead
+from .search import search_profile_ids
+from .pagination import KeysetPaginator, encode_cursor
+from .query_budget import QueryBudgetExceeded
+from .messaging import (
+    conversations_for, mark_read, messages_after, messages_before, save_message, thread_messages, total_unread,
+)
+from .models import Conversation, Course, Job, Match, Message, Profile, ProfileSearch, Review, ReviewStats
+from .routing import websocket_urlpatterns
+from .views import PROFILE_ORDERINGS, REVIEW_ORDERINGS
+
+
+# Templates resolve {% static %} without a collectstatic manifest
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Every request a test makes must stay within its view's @query_budget
+ENFORCE_BUDGETS = {'QUERY_BUDGETS': True, 'QUERY_BUDGET_RAISE': True}
+
+
+@override_settings(STORAGES=TEST_STORAGES, JOB_QUEUE_EAGER=True, **ENFORCE_BUDGETS)
+class ProfileCardQueryTests(TestCase):
+    """List pages render profile cards in a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.courses = [Course.objects.create(code=f'GRA{i}', name=f'Finance {i}') for i in range(5)]
+        cls.viewer = cls.make_profile('viewer')
+
+    @classmethod
+    def make_profile(cls, username):
+        user = User.objects.create_user(username=username, password='pw')
+        profile = Profile.objects.create(
+            user=user, fname='Finance', lname=username, email=f'{username}@example.com', major='Finance',
+        )
+        profile.courses.set(cls.courses)
+        return profile
+
+    def setUp(self):
+        self.client.force_login(self.viewer.user)
+
+    def count_queries(self, url, params=None):
+        # The first hit refills caches (featured pool, counts); measure the steady state
+        cache.clear()
+        self.client.get(url, params)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertFlatQueries(self, url, params=None):
+        """Same query count with one other card as with a full page of them"""
+        self.make_profile('first')
+        few = self.count_queries(url, params)
+        for i in range(9):
+            self.make_profile(f'other{i}')
+        self.assertEqual(self.count_queries(url, params), few)
+
+    def test_profile_list(self):
+        self.assertFlatQueries(reverse('studybuddy_app:profile_list'))
+
+    def test_profile_list_by_rating(self):
+        self.assertFlatQueries(reverse('studybuddy_app:profile_list'), {'sort': 'rating'})
+
+    def test_search_buddies(self):
+        self.assertFlatQueries(reverse('studybuddy_app:search_buddies'), {'q': 'finance'})
+
+    def test_find_buddies(self):
+        self.assertFlatQueries(reverse('studybuddy_app:find_buddies'))
+
+    def test_index(self):
+        self.assertFlatQueries(reverse('studybuddy_app:index'))
+
+    def test_card_lists_courses_once(self):
+        self.make_profile('first')
+        response = self.client.get(reverse('studybuddy_app:profile_list'))
+        self.assertContains(response, 'GRA0')
+        self.assertContains(response, '+2 more')
+
+
+@override_settings(STORAGES=TEST_STORAGES, JOB_QUEUE_EAGER=True, **ENFORCE_BUDGETS)
+class ProfileCardFragmentTests(TestCase):
+    """Cached profile cards are reused until something on the card changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create(code='GRA6547', name='Research Methodology')
+        viewer = User.objects.create_user(username='viewer', password='pw')
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.profile = Profile.objects.create(user=self.user, fname='Alice', lname='A', email='a@example.com')
+        self.client.force_login(viewer)
+        self.url = reverse('studybuddy_app:profile_list')
+
+    def test_second_render_is_a_hit(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(fragments.stats()['list_card'], (1, 1))
+
+    def test_course_change_invalidates_card(self):
+        self.assertNotContains(self.client.get(self.url), 'GRA6547')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.courses.add(self.course)
+        self.assertContains(self.client.get(self.url), 'GRA6547')
+        self.course.code = 'GRA6548'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()
+        self.assertContains(self.client.get(self.url), 'GRA6548')
+
+    def test_review_invalidates_card(self):
+        self.assertNotContains(self.client.get(self.url), '1 review')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(reviewer=User.objects.get(username='viewer'), reviewed_user=self.user, rating=4)
+        self.assertContains(self.client.get(self.url), '1 review')
+
+    def test_bump_waits_for_commit(self):
+        before = fragments.version(self.profile.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.fname = 'Alicia'
+            self.profile.save()
+            self.assertEqual(fragments.version(self.profile.id), before)
+        self.assertNotEqual(fragments.version(self.profile.id), before)
+
+    def test_login_keeps_cards(self):
+        before = fragments.version(self.profile.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.client.login(username='alice', password='pw'))
+        self.assertEqual(fragments.version(self.profile.id), before)
+
+
+class CourseCatalogTests(TestCase):
+    """The cached course catalog is dropped once a course change commits"""
+
+    def test_rename_is_visible_after_commit(self):
+        cache.clear()
+        course = Course.objects.create(code='GRA6547', name='Research Methodology')
+        catalog.courses()
+        with self.captureOnCommitCallbacks(execute=True):
+            course.code = 'GRA6548'
+            course.save()
+            self.assertIsNotNone(cache.get(catalog.CATALOG_KEY))
+        self.assertEqual([listed.code for listed in catalog.courses()], ['GRA6548'])
+
+
+@override_settings(JOB_QUEUE_EAGER=True)
+class MatchTests(TestCase):
+    """Match rows follow course membership changes made from either side"""
+
+    def setUp(self):
+        self.x = Course.objects.create(code='GRA1', name='Course X')
+        self.y = Course.objects.create(code='GRA2', name='Course Y')
+        self.a, self.b, self.c = [
+            Profile.objects.create(
+                user=User.objects.create_user(username=name, password='pw'),
+                fname=name, lname=name, email=f'{name}@example.com',
+            )
+            for name in ('a', 'b', 'c')
+        ]
+
+    def matches(self):
+        return {
+            (*sorted((first, second)), code)
+            for first, second, code in Match.objects.values_list('profile1__fname', 'profile2__fname', 'course__code')
+        }
+
+    def test_profile_side(self):
+        self.a.courses.add(self.x, self.y)
+        self.b.courses.add(self.x)
+        self.assertEqual(self.matches(), {('a', 'b', 'GRA1')})
+        self.c.courses.add(self.x, self.y)
+        self.assertEqual(self.matches(), {
+            ('a', 'b', 'GRA1'), ('a', 'c', 'GRA1'), ('b', 'c', 'GRA1'), ('a', 'c', 'GRA2'),
+        })
+        self.a.courses.remove(self.x)
+        self.assertEqual(self.matches(), {('b', 'c', 'GRA1'), ('a', 'c', 'GRA2')})
+        self.c.courses.clear()
+        self.assertEqual(self.matches(), set())
+        self.c.courses.set([self.y])
+        self.assertEqual(self.matches(), {('a', 'c', 'GRA2')})
+
+    def test_course_side(self):
+        self.x.students.add(self.a, self.b, self.c)
+        self.assertEqual(self.matches(), {('a', 'b', 'GRA1'), ('a', 'c', 'GRA1'), ('b', 'c', 'GRA1')})
+        self.x.students.remove(self.b)
+        self.assertEqual(self.matches(), {('a', 'c', 'GRA1')})
+        self.y.students.add(self.a, self.c)
+        self.assertEqual(self.matches(), {('a', 'c', 'GRA1'), ('a', 'c', 'GRA2')})
+        self.x.students.clear()
+        self.assertEqual(self.matches(), {('a', 'c', 'GRA2')})
+
+    def test_profile_delete(self):
+        self.x.students.add(self.a, self.b, self.c)
+        self.b.delete()
+        self.assertEqual(self.matches(), {('a', 'c', 'GRA1')})
+
+    def test_rebuild_matches(self):
+        self.x.students.add(self.a, self.b)
+        self.y.students.add(self.b, self.c)
+        Match.objects.filter(course=self.x).delete()
+        Match.objects.create(profile1=self.a, profile2=self.c, course=self.y)
+
+        out = StringIO()
+        call_command('rebuild_matches', dry_run=True, workers=1, stdout=out)
+        self.assertIn('would change 2 rows (1 added, 1 removed)', out.getvalue())
+        self.assertEqual(self.matches(), {('a', 'c', 'GRA2'), ('b', 'c', 'GRA2')})
+
+        call_command('rebuild_matches', workers=1, stdout=StringIO())
+        self.assertEqual(self.matches(), {('a', 'b', 'GRA1'), ('b', 'c', 'GRA2')})
+
+
+class ReviewAggregateTests(TestCase):
+    """Profile.rating and ReviewStats follow every review change without a recount"""
+
+    def setUp(self):
+        self.ann, self.ben, self.cat = [
+            User.objects.create_user(username=name, password='pw') for name in ('ann', 'ben', 'cat')
+        ]
+        for user in (self.ann, self.ben, self.cat):
+            Profile.objects.create(user=user, fname=user.username, lname='L', email=f'{user.username}@example.com')
+
+    def assertAggregates(self, profiles, site):
+        """profiles: {user: (review_count, rating_sum, rating)}; site: ReviewStats counters"""
+        for user, expected in profiles.items():
+            profile = Profile.objects.get(user=user)
+            self.assertEqual((profile.review_count, profile.rating_sum, profile.rating), expected, user.username)
+        stats = ReviewStats.load()
+        self.assertEqual(
+            (stats.total_reviews, stats.rating_sum, stats.five_star_count, stats.active_reviewers), site,
+        )
+        # And the same as recounting from scratch
+        self.assertEqual(reviews.sync_profile_aggregates(dry_run=True), 0)
+        self.assertFalse(reviews.sync_site_stats(dry_run=True))
+
+    def test_create_edit_reassign_delete(self):
+        first = Review.objects.create(reviewer=self.ann, reviewed_user=self.ben, rating=5)
+        second = Review.objects.create(reviewer=self.cat, reviewed_user=self.ben, rating=2)
+        self.assertAggregates({self.ben: (2, 7, 3.5), self.cat: (0, 0, 0.0)}, (2, 7, 1, 2))
+
+        first.rating = 4
+        first.save()
+        self.assertAggregates({self.ben: (2, 6, 3.0)}, (2, 6, 0, 2))
+
+        second.reviewed_user = self.ann
+        second.save()
+        self.assertAggregates({self.ben: (1, 4, 4.0), self.ann: (1, 2, 2.0)}, (2, 6, 0, 2))
+
+        second.reviewer = self.ben
+        second.save()
+        self.assertAggregates({self.ann: (1, 2, 2.0)}, (2, 6, 0, 2))
+
+        first.delete()
+        self.assertAggregates({self.ben: (0, 0, 0.0), self.ann: (1, 2, 2.0)}, (1, 2, 0, 1))
+
+    def test_delete_last_review(self):
+        review = Review.objects.create(reviewer=self.ann, reviewed_user=self.ben, rating=5)
+        review.delete()
+        self.assertAggregates({self.ben: (0, 0, 0.0)}, (0, 0, 0, 0))
+
+
+class FeaturedTests(TestCase):
+    """The homepage's featured profiles are weighted draws from a cached candidate pool"""
+
+    def setUp(self):
+        cache.clear()
+        self.profiles = []
+        for i in range(12):
+            user = User.objects.create_user(username=f'user{i}')
+            self.profiles.append(Profile.objects.create(user=user, fname=f'user{i}', lname='L', email=f'user{i}@example.com'))
+        self.viewer = self.profiles[0]
+
+    def test_pool_is_top_rated_and_recently_active(self):
+        start = timezone.now() - timedelta(days=30)
+        for i, profile in enumerate(self.profiles):
+            Profile.objects.filter(id=profile.id).update(rating=i % 5, updated_at=start + timedelta(hours=i))
+        top_rated = {profile.id for i, profile in enumerate(self.profiles) if i % 5 == 4}
+        recent = {profile.id for profile in self.profiles[-3:]}
+        with mock.patch.object(featured, 'TOP_RATED', 2), mock.patch.object(featured, 'RECENTLY_ACTIVE', 3), \
+                mock.patch.object(featured, '_random_ids', return_value=set()):
+            pool = featured.build_pool()
+        self.assertEqual(set(pool), top_rated | recent)
+        self.assertEqual({pool[profile.id] for profile in self.profiles if profile.id in top_rated}, {5.0})
+
+        with mock.patch.object(featured, 'get_pool', return_value=pool):
+            picked = featured.featured_profiles(self.viewer.user, count=3)
+        self.assertEqual(len(picked), 3)
+        self.assertLessEqual({profile.id for profile in picked}, set(pool))
+
+    def test_viewer_is_never_featured(self):
+        # The viewer outweighs everyone else, so they are always drawn
+        pool = {profile.id: 1.0 for profile in self.profiles[1:4]}
+        pool[self.viewer.id] = 1000.0
+        with mock.patch.object(featured, 'get_pool', return_value=pool):
+            for _ in range(5):
+                picked = featured.featured_profiles(self.viewer.user, count=3)
+                self.assertEqual({profile.id for profile in picked}, {profile.id for profile in self.profiles[1:4]})
+
+    def test_pool_smaller_than_count(self):
+        pool = {profile.id: 1.0 for profile in self.profiles[:3]}
+        self.assertEqual(sorted(featured.sample(pool, 5)), sorted(pool))
+        self.assertEqual(sorted(featured.sample(pool, 5, exclude={self.viewer.id})), sorted(set(pool) - {self.viewer.id}))
+        with mock.patch.object(featured, 'get_pool', return_value=pool):
+            picked = featured.featured_profiles(self.viewer.user, count=5)
+        self.assertEqual({profile.id for profile in picked}, {profile.id for profile in self.profiles[1:3]})
+
+
+@override_settings(STORAGES=TEST_STORAGES, JOB_QUEUE_EAGER=True)
+class SearchTests(TestCase):
+    """Full-text search ranks profiles and follows every change to what they show"""
+
+    def setUp(self):
+        self.course = Course.objects.create(code='GRA4100', name='Quantum Basket Weaving')
+        self.ann = self.make('ann', major='Finance', bio='Finance, finance and more finance')
+        self.ben = self.make('ben', major='History', bio='History student who took one finance elective')
+
+    def make(self, username, **fields):
+        user = User.objects.create_user(username=username, password='pw')
+        return Profile.objects.create(user=user, fname=username, lname='L', email=f'{username}@example.com', **fields)
+
+    def test_ranking(self):
+        self.assertEqual(search_profile_ids('finance'), [self.ann.id, self.ben.id])
+        self.assertEqual(search_profile_ids('fin'), [self.ann.id, self.ben.id])
+        self.assertEqual(search_profile_ids('history finance'), [self.ben.id])
+        self.assertEqual(search_profile_ids('chemistry'), [])
+
+    def test_follows_profile_user_and_course_changes(self):
+        self.ben.major = 'Chemistry'
+        self.ben.save()
+        self.assertEqual(search_profile_ids('chemistry'), [self.ben.id])
+
+        self.ben.user.username = 'benedict'
+        self.ben.user.save()
+        self.assertEqual(search_profile_ids('benedict'), [self.ben.id])
+
+        self.ann.courses.add(self.course)
+        self.assertEqual(search_profile_ids('basket'), [self.ann.id])
+        self.course.students.add(self.ben)
+        self.assertEqual(set(search_profile_ids('basket')), {self.ann.id, self.ben.id})
+
+        self.course.name = 'Applied Basket Weaving'
+        self.course.save()
+        self.assertEqual(set(search_profile_ids('applied')), {self.ann.id, self.ben.id})
+
+        self.ann.courses.remove(self.course)
+        self.course.students.clear()
+        self.assertEqual(search_profile_ids('basket'), [])
+
+    def test_course_delete(self):
+        self.course.students.add(self.ann)
+        self.course.delete()
+        self.assertEqual(search_profile_ids('basket'), [])
+
+    @override_settings(JOB_QUEUE_EAGER=False)
+    def test_login_queues_nothing(self):
+        Job.objects.all().delete()
+        self.assertTrue(self.client.login(username='ann', password='pw'))
+        self.assertFalse(Job.objects.exists())
+
+    def test_view_excludes_the_searcher(self):
+        self.client.force_login(self.ann.user)
+        response = self.client.get(reverse('studybuddy_app:search_buddies'), {'q': 'finance'})
+        self.assertEqual([profile.id for profile in response.context['page_obj']], [self.ben.id])
+
+
+@override_settings(JOB_QUEUE_EAGER=True)
+class TypeaheadTests(TestCase):
+    """Suggestions come from the in-memory prefix index, updated in place"""
+
+    def setUp(self):
+        cache.clear()
+        typeahead._index.invalidate()
+        self.addCleanup(typeahead._index.invalidate)
+        self.weaving = Course.objects.create(code='GRA4100', name='Basket Weaving')
+        self.finance = Course.objects.create(code='GRA6035', name='Corporate Finance')
+        self.finn = self.make('finn', 'Finance')
+        self.fiona = self.make('fiona', 'Finance')
+
+    def make(self, username, major):
+        user = User.objects.create_user(username=username, password='pw')
+        return Profile.objects.create(user=user, fname=username, lname='L', email=f'{username}@example.com', major=major)
+
+    def labels(self, prefix, limit=10):
+        return [suggestion['label'] for suggestion in typeahead.suggest(prefix, limit)]
+
+    def test_prefix_matching_and_order(self):
+        # By matched key, then kind: 'finance' (the course name word, then the major), 'finn', 'fiona'
+        self.assertEqual(self.labels('fi'), ['GRA6035 - Corporate Finance', 'Finance', 'finn', 'fiona'])
+        self.assertEqual(self.labels('  WEAV '), ['GRA4100 - Basket Weaving'])
+        # A course found under both its code and name is suggested once
+        self.assertEqual(self.labels('gra4'), ['GRA4100 - Basket Weaving'])
+        self.assertEqual(self.labels('zz'), [])
+        self.assertEqual(self.labels(''), [])
+
+    def test_limit(self):
+        self.assertEqual(self.labels('fi', limit=2), ['GRA6035 - Corporate Finance', 'Finance'])
+
+    def test_course_save_and_delete(self):
+        self.labels('gra')
+        self.weaving.code = 'GRA4200'
+        self.weaving.save()
+        self.assertEqual(self.labels('gra42'), ['GRA4200 - Basket Weaving'])
+        self.assertEqual(self.labels('gra41'), [])
+        self.weaving.delete()
+        self.assertEqual(self.labels('basket'), [])
+
+    def test_profile_save_and_delete(self):
+        self.labels('fi')
+        self.finn.major = 'History'
+        self.finn.save()
+        self.assertEqual(self.labels('hist'), ['History'])
+        self.finn.user.username = 'phineas'
+        self.finn.user.save()
+        self.assertEqual(self.labels('phin'), ['phineas'])
+        self.assertEqual(self.labels('finn'), [])
+        # The major stays while one profile still has it
+        self.assertEqual(self.labels('finance'), ['GRA6035 - Corporate Finance', 'Finance'])
+        self.fiona.delete()
+        self.assertEqual(self.labels('fi'), ['GRA6035 - Corporate Finance'])
+
+    def test_login_leaves_the_index_alone(self):
+        with mock.patch.object(typeahead, 'profile_saved') as profile_saved:
+            self.assertTrue(self.client.login(username='finn', password='pw'))
+        profile_saved.assert_not_called()
+
+    def test_view(self):
+        response = self.client.get(reverse('studybuddy_app:search_suggest'), {'q': 'weav'})
+        self.assertEqual(response.json(), {'suggestions': [
+            {'type': 'course', 'label': 'GRA4100 - Basket Weaving', 'value': 'GRA4100'},
+        ]})
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class JobQueueTests(TestCase):
+    """Profile changes queue their slow side effects for the worker"""
+
+    def setUp(self):
+        self.courses = [Course.objects.create(code=f'GRA{i}', name=f'Course {i}') for i in range(2)]
+        self.profiles = []
+        for name in ('alice', 'bob'):
+            user = User.objects.create_user(username=name, password='pw')
+            self.profiles.append(Profile.objects.create(user=user, fname=name, lname=name, email=f'{name}@example.com'))
+        # Start each test from an empty queue (creating profiles queued search refreshes)
+        Job.objects.all().delete()
+
+    def drain(self):
+        while True:
+            claimed = jobs.claim('test')
+            if not claimed:
+                return
+            for job in claimed:
+                jobs.run(job)
+
+    def test_identical_pending_jobs_are_deduplicated(self):
+        alice, bob = self.profiles
+        bob.courses.add(self.courses[0])
+        alice.courses.add(self.courses[0])
+        alice.courses.remove(self.courses[0])
+        alice.courses.add(self.courses[0])
+        self.assertEqual(Job.objects.filter(kind='profile_courses', status=Job.PENDING).count(), 3)
+        # The repeated add was dropped; the remove runs after it, yet alice is enrolled again
+        self.drain()
+        self.assertEqual(Match.objects.filter(course=self.courses[0]).count(), 1)
+
+    def test_worker_builds_matches(self):
+        for profile in self.profiles:
+            profile.courses.set(self.courses)
+        self.assertFalse(Match.objects.exists())
+        self.drain()
+        self.assertEqual(Match.objects.count(), 2)
+        self.profiles[1].courses.remove(self.courses[0])
+        self.drain()
+        self.assertEqual(list(Match.objects.values_list('course_id', flat=True)), [self.courses[1].id])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+        self.assertFalse(Job.objects.filter(duration_ms__isnull=True).exists())
+
+    def test_batch_queues_each_job_once(self):
+        alice = self.profiles[0]
+        with CaptureQueriesContext(connection) as queries, jobs.batch():
+            alice.save()
+            alice.courses.set(self.courses)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT') and '"studybuddy_app_job"' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Job.objects.filter(kind='refresh_search').count(), 1)
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        jobs.enqueue('profile_courses', profile_id=self.profiles[0].id)
+        self.assertEqual(len(jobs.claim('one')), 1)
+        self.assertEqual(jobs.claim('two'), [])
+
+    def test_long_arguments_are_queued_and_deduplicated(self):
+        students = [
+            Profile.objects.create(
+                user=User.objects.create_user(username=f'student{i}', password='pw'),
+                fname='S', lname=str(i), email=f'{i}@example.com',
+            )
+            for i in range(100)
+        ]
+        Job.objects.all().delete()
+        for _ in range(2):
+            self.courses[0].students.add(*students)
+        job = Job.objects.get(kind='course_students')
+        self.assertGreater(len(job.args), 255)
+        self.assertEqual(len(job.args_hash), 64)
+        self.drain()
+        self.assertEqual(Match.objects.count(), 100 * 99 // 2)
+
+    def test_job_that_kills_its_worker_is_failed_not_retried(self):
+        stale = timezone.now() - timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+        job = Job.objects.create(kind='refresh_search', status=Job.RUNNING, attempts=5, max_attempts=5, locked_at=stale)
+        self.assertEqual(jobs.claim('test'), [])
+        self.assertEqual(jobs.reap(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        Job.objects.create(kind='no_such_kind', max_attempts=2)
+        job, = jobs.claim('test')
+        self.assertFalse(jobs.run(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(jobs.claim('test'), [])
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        job, = jobs.claim('test')
+        jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('no_such_kind', job.last_error)
+
+
+@override_settings(STORAGES=TEST_STORAGES, JOB_QUEUE_EAGER=False)
+class PictureVariantTests(TestCase):
+    """Pages show an uploaded picture as is until its variants have been generated"""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        image = BytesIO()
+        Image.new('RGB', (800, 600), 'teal').save(image, 'PNG')
+        user = User.objects.create_user(username='alice', password='pw')
+        self.profile = Profile.objects.create(
+            user=user, fname='Alice', lname='A', email='a@example.com',
+            picture=SimpleUploadedFile('alice.png', image.getvalue()),
+        )
+        self.client.force_login(user)
+        self.url = reverse('studybuddy_app:profile', args=[self.profile.id])
+
+    def run_jobs(self):
+        for job in jobs.claim('test'):
+            self.assertTrue(jobs.run(job))
+
+    def test_original_until_variants_exist(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, self.profile.picture.url)
+        self.assertNotContains(response, '.webp')
+
+        self.run_jobs()
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.has_picture_variants)
+        self.assertContains(self.client.get(self.url), '_medium.webp')
+
+    def test_save_keeps_variants_written_meanwhile(self):
+        stale = Profile.objects.get(id=self.profile.id)
+        self.run_jobs()
+        stale.bio = 'Edited before the job finished'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertTrue(stale.has_picture_variants)
+
+    def test_backfill_marks_variants(self):
+        Job.objects.all().delete()
+        call_command('generate_thumbnails', stdout=StringIO())
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.has_picture_variants)
+
+    def test_cached_card_follows_variants_from_another_process(self):
+        viewer = User.objects.create_user(username='viewer', password='pw')
+        self.client.force_login(viewer)
+        url = reverse('studybuddy_app:profile_list')
+        self.assertNotContains(self.client.get(url), '_small.webp')
+        # The worker's bump lands in its own cache, not this process's
+        with mock.patch.object(fragments, 'bump'):
+            self.run_jobs()
+        self.assertContains(self.client.get(url), '_small.webp')
+
+
+class RecommendationTests(TestCase):
+    """recommend() ranks by shared courses, then rating, major and study methods"""
+
+    def setUp(self):
+        cache.clear()
+        for index in (recommendations, course_bitmaps):
+            index.invalidate()
+            self.addCleanup(index.invalidate)
+        self.courses = [Course.objects.create(code=f'GRA{i}', name=f'Course {i}') for i in range(4)]
+
+    def make(self, name, courses, major='', study_methods=''):
+        user = User.objects.create_user(username=name, password='pw')
+        profile = Profile.objects.create(
+            user=user, fname=name, lname=name, email=f'{name}@example.com', major=major, study_methods=study_methods,
+        )
+        profile.courses.set(courses)
+        return profile
+
+    def ranking(self, profile):
+        ranked, total = recommendations.recommend(profile)
+        self.assertEqual(total, len(ranked))
+        return {profile_id: score for profile_id, score, _ in ranked}, [profile_id for profile_id, _, _ in ranked]
+
+    def test_ranking(self):
+        me = self.make('me', self.courses[:3], 'Finance', 'Flashcards, group study')
+        twin = self.make('twin', self.courses[:3], 'finance', 'group  study; FLASHCARDS')
+        classmate = self.make('classmate', self.courses[:3])
+        methods = self.make('methods', self.courses[:1], study_methods='flashcards, group study')
+        one_course = self.make('one', self.courses[:1])
+        disjoint = self.make('disjoint', self.courses[:1], study_methods=', '.join(f'method {i}' for i in range(70)))
+        self.make('outsider', self.courses[3:], 'Finance', 'flashcards')
+
+        scores, order = self.ranking(me)
+        self.assertEqual(order, [twin.id, classmate.id, methods.id, one_course.id, disjoint.id])
+        self.assertAlmostEqual(scores[twin.id], 0.85)
+        # Methods are compared as token sets: no overlap scores exactly nothing
+        self.assertAlmostEqual(scores[disjoint.id], scores[one_course.id])
+
+        # Changes reach the built index through the signal receivers
+        one_course.courses.add(self.courses[1])
+        methods.study_methods = ''
+        methods.save()
+        _, order = self.ranking(me)
+        self.assertEqual(order[:3], [twin.id, classmate.id, one_course.id])
+        twin.delete()
+        self.assertNotIn(twin.id, self.ranking(me)[1])
+
+    @override_settings(STORAGES=TEST_STORAGES, **ENFORCE_BUDGETS)
+    def test_buddy_pages_follow_the_ranking(self):
+        me = self.make('me', self.courses[:3], 'Finance', 'flashcards')
+        others = [
+            self.make(f'other{i}', self.courses[:1 + i % 3], ('Finance', 'History')[i % 2], ('flashcards', '')[i % 4 // 2])
+            for i in range(15)
+        ]
+        Profile.objects.filter(id__in=[profile.id for profile in others[::5]]).update(rating=5.0)
+        recommendations.invalidate()
+        ranked, _ = recommendations.recommend(me)
+        order = [profile_id for profile_id, _, _ in ranked]
+        shared = [count for _, _, count in ranked]
+        self.assertEqual(len(order), 15)
+        # Not simply by shared course count: rating, major and methods weigh in
+        self.assertNotEqual(shared, sorted(shared, reverse=True))
+
+        self.client.force_login(me.user)
+        url = reverse('studybuddy_app:find_buddies_json')
+        pages = [self.client.get(url, {'page': page}).json() for page in (1, 2)]
+        self.assertEqual(pages[0]['total'], 15)
+        self.assertEqual([r['id'] for page in pages for r in page['results']], order)
+
+        page = self.client.get(url, {'any': 'GRA2'}).json()
+        self.assertEqual([r['id'] for r in page['results']], [
+            profile_id for profile_id in order if self.courses[2] in Profile.objects.get(id=profile_id).courses.all()
+        ])
+
+        self.assertEqual(recommendations.recommend(me, offset=12, limit=12)[0], recommendations.recommend(me)[0][12:])
+
+    @override_settings(STORAGES=TEST_STORAGES, **ENFORCE_BUDGETS)
+    def test_filtered_buddy_pages_are_full(self):
+        me = self.make('me', self.courses[:2])
+        close = [self.make(f'close{i}', self.courses[:2]) for i in range(2)]
+        others = [self.make(f'other{i}', [self.courses[0], self.courses[3]] if i % 7 else self.courses[:1])
+                  for i in range(16)]
+        self.client.force_login(me.user)
+        url = reverse('studybuddy_app:find_buddies_json')
+
+        first = self.client.get(url).json()
+        self.assertEqual(first['total'], 18)
+        self.assertEqual([result['id'] for result in first['results'][:2]], [profile.id for profile in close])
+
+        taking = [profile.id for i, profile in enumerate(others) if i % 7]
+        pages = [self.client.get(url, {'all': 'gra3', 'page': page}).json() for page in (1, 2)]
+        self.assertEqual(pages[0]['total'], len(taking))
+        self.assertEqual(len(pages[0]['results']), 12)
+        self.assertEqual([r['id'] for page in pages for r in page['results']], taking)
+
+
+@override_settings(STORAGES=TEST_STORAGES, **ENFORCE_BUDGETS)
+class KeysetPaginatorTests(TestCase):
+    """Cursor pages cover every row once, both ways, on every sort the views offer"""
+
+    # Cursors a client could send: garbage, the wrong shape, values the query can't take
+    TAMPERED = [
+        '!!not-a-cursor',
+        encode_cursor({'id': 1}),
+        encode_cursor([1]),
+        encode_cursor(['high', 'many', 'one']),
+        encode_cursor(['1', '1', str(2 ** 70)]),
+        encode_cursor([None, None, None]),
+        encode_cursor(['nan', '1', '1']),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for i in range(10):
+            user = User.objects.create_user(username=f'user{i}')
+            # Few distinct names, ratings and timestamps, so most sort keys tie
+            Profile.objects.create(
+                user=user, fname=('Kim', 'Lee')[i % 2], lname=('Berg', 'Aas', 'Berg')[i % 3], email=f'{i}@example.com',
+            )
+            cls.users.append(user)
+        for i, reviewer in enumerate(cls.users):
+            for step in (1, 2):
+                Review.objects.create(reviewer=reviewer, reviewed_user=cls.users[(i + step) % 10], rating=i % 3 + 1)
+        stamps = [timezone.now() - timedelta(days=1), timezone.now()]
+        for review in Review.objects.all():
+            Review.objects.filter(id=review.id).update(created_at=stamps[review.id % 2])
+
+    def walk(self, queryset, ordering, per_page=3):
+        """Row ids paging forwards from the first page, and backwards from the last"""
+        paginator = KeysetPaginator(queryset, ordering, per_page)
+        forwards, page = [], paginator.page()
+        self.assertFalse(page.has_previous())
+        while True:
+            forwards += [row.id for row in page]
+            if not page.has_next():
+                break
+            page = paginator.page(after=page.next_cursor)
+            self.assertTrue(page.has_previous())
+        backwards, page = [], paginator.page(last=True)
+        self.assertFalse(page.has_next())
+        while True:
+            backwards = [row.id for row in page] + backwards
+            if not page.has_previous():
+                break
+            page = paginator.page(before=page.previous_cursor)
+            self.assertTrue(page.has_next())
+        return forwards, backwards
+
+    def assertPagesThrough(self, queryset, orderings):
+        for sort, ordering in orderings.items():
+            with self.subTest(sort=sort):
+                expected = list(queryset.order_by(*ordering).values_list('id', flat=True))
+                self.assertEqual(self.walk(queryset, ordering), (expected, expected))
+
+    def test_profile_orderings(self):
+        self.assertPagesThrough(Profile.objects.all(), PROFILE_ORDERINGS)
+
+    def test_review_orderings(self):
+        # 'lowest' mixes directions: rating up, created_at and id down
+        self.assertPagesThrough(Review.objects.all(), REVIEW_ORDERINGS)
+
+    def test_tampered_cursor_gives_first_page(self):
+        paginator = KeysetPaginator(Profile.objects.all(), PROFILE_ORDERINGS['rating'], 3)
+        first = [row.id for row in paginator.page()]
+        for cursor in self.TAMPERED:
+            for direction in ('after', 'before'):
+                with self.subTest(cursor=cursor, direction=direction):
+                    page = paginator.page(**{direction: cursor})
+                    self.assertEqual([row.id for row in page], first)
+                    self.assertFalse(page.has_previous())
+
+    def test_tampered_cursor_in_views(self):
+        self.client.force_login(self.users[0])
+        for name, sort in (('profile_list', 'rating'), ('reviews_list', 'lowest')):
+            url = reverse(f'studybuddy_app:{name}')
+            for cursor in self.TAMPERED:
+                with self.subTest(view=name, cursor=cursor):
+                    response = self.client.get(url, {'sort': sort, 'after': cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotContains(response, 'Error loading')
+                    self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class ChatPagingTests(TestCase):
+    """Chat pages merge both directions of a thread in (created_at, id) order"""
+
+    def setUp(self):
+        self.alice, self.bob, carol = (User.objects.create_user(username=name) for name in ('alice', 'bob', 'carol'))
+        start = timezone.now()
+        for i in range(25):
+            sender, receiver = (self.alice, self.bob) if i % 3 else (self.bob, self.alice)
+            message = Message.objects.create(sender=sender, receiver=receiver, content=str(i))
+            # Pairs of messages share a timestamp, so ids must break the ties
+            Message.objects.filter(id=message.id).update(created_at=start + timedelta(seconds=i // 2))
+            Message.objects.create(sender=self.alice, receiver=carol, content='elsewhere')
+        self.thread = list(
+            Message.objects.filter(content__regex=r'^\d+$').order_by('created_at', 'id').values_list('id', flat=True)
+        )
+
+    def test_pages_backwards_through_the_thread(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = messages_before(thread_messages(self.alice, self.bob), cursor, limit=4)
+            seen = [message.id for message in page] + seen
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.thread)
+
+    def test_messages_after(self):
+        halves = thread_messages(self.bob, self.alice)
+        self.assertEqual([m.id for m in messages_after(halves, self.thread[9], limit=5)], self.thread[10:15])
+        self.assertEqual([m.id for m in messages_after(halves, 0)], self.thread)
+        self.assertEqual(messages_after(halves, self.thread[-1]), [])
+
+    def test_inbox_pages_merge_both_sides(self):
+        users = [User.objects.create_user(username=f'user{i}') for i in range(7)]
+        me = users[3]
+        # Lower ids make me user2 of the conversation, higher ones user1
+        for other in users[:3] + users[4:] + users[:2]:
+            save_message(Message(sender=other, receiver=me, content='Hi'))
+        expected = list(
+            Conversation.objects.filter(Q(user1=me) | Q(user2=me)).order_by('-last_activity').values_list('id', flat=True)
+        )
+        paginator = Paginator(conversations_for(me), 4)
+        self.assertEqual(paginator.count, 6)
+        self.assertEqual([c.id for number in paginator.page_range for c in paginator.page(number)], expected)
+
+
+@override_settings(STORAGES=TEST_STORAGES, **ENFORCE_BUDGETS)
+class ReadPointerTests(TestCase):
+    """Read state is one pointer per user per conversation"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+        self.sent = [save_message(Message(sender=self.alice, receiver=self.bob, content=str(i))) for i in range(3)]
+
+    def conversation(self):
+        return Conversation.objects.get()
+
+    def test_unread_messages_are_past_the_pointer(self):
+        self.assertEqual(total_unread(self.bob.id), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_read(self.bob, self.alice, up_to=self.sent[0].id), self.sent[0].id)
+        self.assertEqual(self.conversation().unread_for(self.bob), 2)
+        self.assertEqual(total_unread(self.bob.id), 2)
+        # Pointers never move back
+        self.assertIsNone(mark_read(self.bob, self.alice, up_to=self.sent[0].id))
+
+    def test_opening_thread_is_a_single_row_write(self):
+        self.client.force_login(self.bob)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('studybuddy_app:chat_thread', kwargs={'user_id': self.alice.id}))
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.conversation().last_read_for(self.bob), self.sent[-1].id)
+        self.assertEqual(total_unread(self.bob.id), 0)
+        self.assertEqual(response.context['partner_read'], 0)
+
+    def test_inbox_leaves_threads_unread(self):
+        self.client.force_login(self.bob)
+        self.client.get(reverse('studybuddy_app:inbox'))
+        self.assertEqual(self.conversation().unread_for(self.bob), 3)
+
+
+class ChatConsumerTests(TransactionTestCase):
+    """The chat socket saves messages and relays them to both ends of the thread.
+
+    A TransactionTestCase: the consumer reaches the database from worker
+    threads, and messages are broadcast once their transaction commits.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+
+    async def connect(self, user, partner_id):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{partner_id}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_rejects_anonymous_users(self):
+        communicator, connected = await self.connect(AnonymousUser(), self.bob.id)
+        self.assertFalse(connected)
+
+    async def test_rejects_self_chat_and_unknown_partners(self):
+        for partner_id in (self.alice.id, self.bob.id + 100):
+            communicator, connected = await self.connect(self.alice, partner_id)
+            self.assertFalse(connected)
+
+    async def test_message_reaches_both_participants(self):
+        alice, connected = await self.connect(self.alice, self.bob.id)
+        self.assertTrue(connected)
+        bob, connected = await self.connect(self.bob, self.alice.id)
+        self.assertTrue(connected)
+
+        await alice.send_json_to({'content': ' Hi Bob ', 'client_id': 'c1'})
+        sent = await alice.receive_json_from()
+        received = await bob.receive_json_from()
+        self.assertEqual(sent['message']['content'], 'Hi Bob')
+        self.assertEqual((sent['message']['sent'], sent['client_id']), (True, 'c1'))
+        self.assertEqual((received['message']['sent'], received['client_id']), (False, None))
+        self.assertEqual(received['message']['id'], sent['message']['id'])
+        # Bob's socket read it, and Alice is told
+        self.assertEqual(await alice.receive_json_from(), {'read': sent['message']['id']})
+
+        message = await Message.objects.aget()
+        self.assertEqual((message.sender_id, message.receiver_id, message.content), (self.alice.id, self.bob.id, 'Hi Bob'))
+        conversation = await Conversation.objects.aget()
+        self.assertEqual(conversation.last_message_id, message.id)
+        self.assertEqual(conversation.last_read_for(self.bob), message.id)
+        self.assertEqual(conversation.unread_for(self.bob), 0)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_empty_message_is_refused(self):
+        alice, _ = await self.connect(self.alice, self.bob.id)
+        await alice.send_json_to({'content': '  ', 'client_id': 'c1'})
+        self.assertEqual(await alice.receive_json_from(), {'error': "Message cannot be empty.", 'client_id': 'c1'})
+        self.assertFalse(await Message.objects.aexists())
+        await alice.disconnect()
+
+
+@override_settings(**ENFORCE_BUDGETS)
+class ChatSinceTests(TransactionTestCase):
+    """chat_since answers polls, holding them open with ?wait= until a message arrives"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.first = save_message(Message(sender=self.bob, receiver=self.alice, content='Hi'))
+        self.url = reverse('studybuddy_app:chat_since', kwargs={'user_id': self.bob.id})
+
+    async def poll(self, **params):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.alice)
+        return await client.get(self.url, params)
+
+    async def test_new_messages(self):
+        response = await self.poll(after=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['id'] for message in response.json()['messages']], [self.first.id])
+        self.assertEqual(response.json()['unread'], 0)
+
+    async def test_nothing_new_is_not_modified(self):
+        response = await self.poll(after=self.first.id)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_wait_returns_when_a_message_arrives(self):
+        async def reply():
+            await asyncio.sleep(0.2)
+            return await sync_to_async(save_message)(Message(sender=self.bob, receiver=self.alice, content='Still there?'))
+
+        response, message = await asyncio.wait_for(
+            asyncio.gather(self.poll(after=self.first.id, wait=10), reply()), timeout=5,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['messages']], [message.id])
+
+    async def test_wait_times_out_empty(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await self.poll(after=self.first.id, wait=0.3)
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(loop.time() - started, 0.3)
+
+    async def test_logged_out_is_401_json(self):
+        response = await AsyncClient().get(self.url, {'after': 0})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': "Authentication required."})
+
+
+@override_settings(STORAGES=TEST_STORAGES, JOB_QUEUE_EAGER=True, **ENFORCE_BUDGETS)
+class QueryPlanTests(TestCase):
+    """No view reads a table that grows with the user base from end to end.
+
+    Each view's queries are EXPLAINed on whichever database the tests run
+    against (SQLite by default, Postgres with DATABASE_URL=postgres://...).
+    """
+
+    # Tables whose size follows the number of users; the course catalog stays small
+    LARGE_TABLES = [
+        model._meta.db_table
+        for model in (User, Profile, Profile.courses.through, ProfileSearch, Match, Message, Conversation, Review, Job)
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        courses = [Course.objects.create(code=f'GRA{i}', name=f'Finance {i}') for i in range(6)]
+        cls.profiles = []
+        for i in range(12):
+            user = User.objects.create_user(username=f'student{i}', password='pw')
+            profile = Profile.objects.create(
+                user=user, fname='Finance', lname=f'Student{i}', email=f's{i}@example.com', major='Finance',
+            )
+            profile.courses.set(courses[i % 3:i % 3 + 3])
+            cls.profiles.append(profile)
+        cls.users = [profile.user for profile in cls.profiles]
+        for other in cls.users[1:6]:
+            save_message(Message(sender=other, receiver=cls.users[0], content='Study tonight?'))
+            save_message(Message(sender=cls.users[0], receiver=other, content='Sure'))
+            Review.objects.create(reviewer=other, reviewed_user=cls.users[0], rating=4)
+            Review.objects.create(reviewer=cls.users[0], reviewed_user=other, rating=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.users[0])
+
+    def assertNoFullScans(self, name, *args, params=None):
+        url = reverse(f'studybuddy_app:{name}', args=args)
+        # The first hit builds per-process indexes and fills caches; audit the steady state
+        self.client.get(url, params)
+        recorder = query_plans.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        findings = query_plans.audit(recorder.queries, self.LARGE_TABLES)
+        if findings:
+            self.fail('\n\n'.join(
+                f"Full scan of {', '.join(sorted(tables))}:\n{sql}\n" + '\n'.join(plan)
+                for sql, plan, tables in findings
+            ))
+
+    def test_profile_pages(self):
+        other = self.profiles[1]
+        self.assertNoFullScans('index')
+        self.assertNoFullScans('profile', other.id)
+        self.assertNoFullScans('user_profile', other.id)
+        self.assertNoFullScans('leave_review', self.profiles[8].id)
+
+    def test_lists(self):
+        self.assertNoFullScans('profile_list')
+        self.assertNoFullScans('profile_list', params={'sort': 'rating'})
+        self.assertNoFullScans('reviews_list')
+        self.assertNoFullScans('reviews_list', params={'sort': 'highest'})
+
+    def test_buddies_and_search(self):
+        self.assertNoFullScans('find_buddies')
+        self.assertNoFullScans('find_buddies_json')
+        self.assertNoFullScans('search_buddies', params={'q': 'finance'})
+        self.assertNoFullScans('search_buddies', params={'all': 'GRA1'})
+
+    def test_messaging(self):
+        partner = self.users[1]
+        self.assertNoFullScans('inbox')
+        self.assertNoFullScans('send_message', partner.id)
+        self.assertNoFullScans('chat_thread', partner.id)
+        self.assertNoFullScans('chat_history', partner.id)
+        self.assertNoFullScans('chat_since', partner.id, params={'after': 0})
+        self.assertNoFullScans('reply_message', Message.objects.filter(receiver=self.users[0]).first().id)
+
+    def test_sorted_page_is_flagged(self):
+        # Both directions of a thread in one query: each page sorts every message in it
+        a, b = self.users[:2]
+        page = Message.objects.filter(
+            Q(sender=a, receiver=b) | Q(sender=b, receiver=a),
+        ).order_by('-created_at', '-id')[:31]
+        findings = query_plans.audit([page.query.sql_with_params()], self.LARGE_TABLES)
+        self.assertEqual([tables for sql, plan, tables in findings], [{Message._meta.db_table}])
+
+
+def pg_node(kind, *children, **fields):
+    """One node of a Postgres EXPLAIN (FORMAT JSON) plan"""
+    node = {'Node Type': kind, **{name.replace('_', ' '): value for name, value in fields.items()}}
+    if children:
+        node['Plans'] = list(children)
+    return node
+
+
+class QueryPlanParsingTests(SimpleTestCase):
+    """full_scans() on canned plans, so both databases are covered wherever the tests run"""
+
+    MESSAGE = 'studybuddy_app_message'
+
+    def scans(self, plan, limited=True):
+        return query_plans.full_scans(plan, 'postgresql', limited=limited)
+
+    def test_postgres_sorted_index_walk(self):
+        for direction in ('Forward', 'Backward'):
+            with self.subTest(direction=direction):
+                walk = pg_node('Index Scan', Scan_Direction=direction, Index_Name='msg_idx', Relation_Name=self.MESSAGE)
+                self.assertEqual(self.scans(pg_node('Limit', pg_node('Sort', walk))), {self.MESSAGE})
+                # Rows come out in the wanted order: the walk stops at the LIMIT
+                self.assertEqual(self.scans(pg_node('Limit', walk)), set())
+
+    def test_postgres_sort_over_search(self):
+        search = pg_node(
+            'Bitmap Heap Scan',
+            pg_node('BitmapOr',
+                    pg_node('Bitmap Index Scan', Index_Name='msg_idx', Index_Cond='(sender_id = 1)'),
+                    pg_node('Bitmap Index Scan', Index_Name='msg_idx', Index_Cond='(sender_id = 2)')),
+            Relation_Name=self.MESSAGE, Recheck_Cond='(sender_id = 1) OR (sender_id = 2)',
+        )
+        user = pg_node('Index Scan', Index_Name='auth_user_pkey', Relation_Name='auth_user', Index_Cond='(id = 1)')
+        plan = pg_node('Limit', pg_node('Sort', pg_node('Nested Loop', search, user)))
+        self.assertEqual(self.scans(plan), {self.MESSAGE})
+        self.assertEqual(self.scans(plan, limited=False), set())
+
+    def test_postgres_seq_scan_and_hash_aggregate(self):
+        self.assertEqual(self.scans(pg_node('Seq Scan', Relation_Name=self.MESSAGE)), {self.MESSAGE})
+        walk = pg_node('Index Only Scan', Scan_Direction='Backward', Index_Name='msg_idx', Relation_Name=self.MESSAGE)
+        self.assertEqual(self.scans(pg_node('Limit', pg_node('Aggregate', walk, Strategy='Hashed'))), {self.MESSAGE})
+
+    def test_sqlite(self):
+        plan = ['SEARCH m USING INDEX msg_idx (sender_id=?)', 'USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(query_plans.full_scans(plan, 'sqlite', limited=True), {'m'})
+        self.assertEqual(query_plans.full_scans(plan[:1], 'sqlite', limited=True), set())
+        self.assertEqual(query_plans.full_scans(['SCAN m'], 'sqlite'), {'m'})
+
+    def test_plan_lines(self):
+        plan = pg_node('Limit', pg_node('Index Scan', Scan_Direction='Backward', Index_Name='msg_idx',
+                                        Relation_Name=self.MESSAGE, Index_Cond='(sender_id = 1)'))
+        self.assertEqual(query_plans.plan_lines(plan, 'postgresql'), [
+            'Limit',
+            f'  Index Scan Backward using msg_idx on {self.MESSAGE} [Index Cond: (sender_id = 1)]',
+        ])
+
+    def test_other_databases_are_skipped(self):
+        other = mock.Mock(vendor='oracle')
+        with self.assertWarns(RuntimeWarning):
+            self.assertEqual(query_plans.audit([('SELECT 1', [])], [self.MESSAGE], using=other), [])
+        other.cursor.assert_not_called()
+
+
+@override_settings(STORAGES=TEST_STORAGES, **ENFORCE_BUDGETS)
+class QueryBudgetTests(TestCase):
+    """QueryBudgetMiddleware holds requests to their view's @query_budget"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+        self.client.force_login(self.alice)
+
+    def test_every_view_declares_a_budget(self):
+        missing = [
+            pattern.name for pattern in get_resolver('studybuddy_app.urls').url_patterns
+            if not hasattr(pattern.callback, 'query_budget')
+        ]
+        self.assertEqual(missing, [])
+
+    def test_response_reports_queries(self):
+        response = self.client.get(reverse('studybuddy_app:inbox'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    def test_profile_edit_stays_within_budget(self):
+        courses = [Course.objects.create(code=f'GRA{i}', name=f'Course {i}') for i in range(3)]
+        profile = Profile.objects.create(user=self.alice, fname='Alice', lname='A', email='alice@example.com')
+        profile.courses.set(courses[:2])
+        response = self.client.post(reverse('studybuddy_app:profile_edit', args=[profile.id]), {
+            'fname': 'Alice', 'lname': 'A', 'courses': [course.id for course in courses[1:]],
+        })
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(QUERY_BUDGET_MAX_REPEATS=0)
+    def test_repeated_query_shape_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'studybuddy_app:inbox'):
+            self.client.get(reverse('studybuddy_app:inbox'))
+
+    @override_settings(QUERY_BUDGETS=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('studybuddy_app:inbox'))
+        self.assertNotIn('Server-Timing', response)
+
+    async def test_async_view_queries_are_counted(self):
+        save = sync_to_async(save_message)
+        await save(Message(sender=self.bob, receiver=self.alice, content='Hi'))
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.alice)
+        response = await client.get(reverse('studybuddy_app:chat_since', kwargs={'user_id': self.bob.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
 
-# Create your tests here.
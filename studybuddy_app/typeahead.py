@@ -0,0 +1,153 @@
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DatabaseError
+
+from . import catalog
+from .models import Profile
+from .process_index import ProcessIndex
+
+
+def _words(*texts):
+    """Lower-cased keys a suggestion is found under: the whole text and each word"""
+    keys = set()
+    for text in texts:
+        text = (text or '').strip().lower()
+        if text:
+            keys.add(text)
+            keys.update(text.split())
+    return keys
+
+
+class PrefixIndex:
+    """Sorted (key, kind, id) array searched with bisect.
+
+    A lookup is a binary search to the first key >= prefix followed by a walk
+    while keys still start with it, so it never touches the database.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.suggestions = {}
+        self.entries = {}
+        self.majors = Counter()
+        self.profile_majors = {}
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        for course in catalog.courses():
+            index.put_course(course.id, course.code, course.name)
+        profiles = Profile.objects.values_list('id', 'user__username', 'major').order_by()
+        for profile_id, username, major in profiles:
+            index.put_profile(profile_id, username, major)
+        index.keys.sort()
+        return index
+
+    def _put(self, kind, obj_id, keys, suggestion, presorted=False):
+        self._drop(kind, obj_id)
+        entries = [(key, kind, obj_id) for key in keys]
+        for entry in entries:
+            if presorted:
+                self.keys.append(entry)
+            else:
+                insort(self.keys, entry)
+        self.entries[kind, obj_id] = entries
+        self.suggestions[kind, obj_id] = suggestion
+
+    def _drop(self, kind, obj_id):
+        for entry in self.entries.pop((kind, obj_id), []):
+            position = bisect_left(self.keys, entry)
+            if position < len(self.keys) and self.keys[position] == entry:
+                del self.keys[position]
+        self.suggestions.pop((kind, obj_id), None)
+
+    def put_course(self, course_id, code, name, presorted=True):
+        self._put('course', course_id, _words(code, name), {
+            'type': 'course',
+            'label': f"{code} - {name}",
+            'value': code,
+        }, presorted)
+
+    def drop_course(self, course_id):
+        self._drop('course', course_id)
+
+    def put_profile(self, profile_id, username, major, presorted=True):
+        self._release_major(self.profile_majors.pop(profile_id, None))
+        major = (major or '').strip()
+        self._put('user', profile_id, _words(username), {
+            'type': 'user',
+            'label': username,
+            'value': username,
+            'profile_id': profile_id,
+        }, presorted)
+        if major:
+            self.profile_majors[profile_id] = major
+            self.majors[major] += 1
+            if self.majors[major] == 1:
+                self._put('major', major, _words(major), {'type': 'major', 'label': major, 'value': major}, presorted)
+
+    def drop_profile(self, profile_id):
+        self._release_major(self.profile_majors.pop(profile_id, None))
+        self._drop('user', profile_id)
+
+    def _release_major(self, major):
+        if major:
+            self.majors[major] -= 1
+            if self.majors[major] <= 0:
+                del self.majors[major]
+                self._drop('major', major)
+
+    def lookup(self, prefix, limit=10):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        position = bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and len(found) < limit:
+            key, kind, obj_id = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            if (kind, obj_id) not in seen:
+                seen.add((kind, obj_id))
+                found.append(self.suggestions[kind, obj_id])
+            position += 1
+        return found
+
+
+_index = ProcessIndex(PrefixIndex.build, ttl=getattr(settings, 'TYPEAHEAD_INDEX_TTL', 300))
+
+
+def warm():
+    """Build the index at worker start; skipped if the tables aren't there yet"""
+    try:
+        _index.get()
+    except (DatabaseError, SynchronousOnlyOperation):
+        pass
+
+
+def suggest(prefix, limit=10):
+    return _index.read(lambda index: index.lookup(prefix, limit))
+
+
+def _apply(method, *args):
+    _index.apply(lambda index: getattr(index, method)(*args))
+
+
+def course_saved(course):
+    _apply('put_course', course.id, course.code, course.name, False)
+
+
+def course_deleted(course_id):
+    _apply('drop_course', course_id)
+
+
+def profile_saved(profile):
+    _apply('put_profile', profile.id, profile.user.username, profile.major, False)
+
+
+def profile_deleted(profile_id):
+    _apply('drop_profile', profile_id)
@@ -34,6 +34,9 @@ urlpatterns = [
     # STUDY BUDDY MATCHING
     # ===========================================
     path('find-buddies/', login_required(views.find_buddies), name='find_buddies'),
+    path('find-buddies/json/', login_required(views.find_buddies_json), name='find_buddies_json'),
+    path('search/', views.search_buddies, name='search_buddies'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     
     # ===========================================
     # MESSAGING SYSTEM
@@ -41,6 +44,8 @@ urlpatterns = [
     path('inbox/', login_required(views.inbox), name='inbox'),
     path('send-message/<int:receiver_id>/', login_required(views.send_message), name='send_message'),
     path('chat/<int:user_id>/', login_required(views.chat_thread), name='chat_thread'),
+    path('chat/<int:user_id>/history/', login_required(views.chat_history), name='chat_history'),
+    path('chat/<int:user_id>/since/', views.chat_since, name='chat_since'),  # checks auth itself (async view)
     path('reply/<int:sender_id>/', login_required(views.reply_message), name='reply_message'),
     
     # ===========================================
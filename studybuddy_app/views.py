@@ -1,63 +1,59 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
-from django.db.models import Q, Avg, Count, F
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse
 from django.core.paginator import Paginator
+from django.utils.http import urlencode
 
 
 from .forms import (
     ProfileAddForm, ReviewForm, ProfileEditForm, MessageForm, CustomUserCreationForm
 )
 from .models import (
-    Profile, Message, Review, Match
+    Profile, Message, Review, ReviewStats
 )
-
-
-def create_matches_for_profile(profile):
-    """Create matches for a profile based on shared courses"""
-    others = Profile.objects.exclude(id=profile.id)
-
-    for other in others:
-        shared_courses = profile.courses.filter(id__in=other.courses.values_list("id", flat=True))
-        for course in shared_courses:
-            # Ensure order is consistent (profile1.id < profile2.id)
-            profile1, profile2 = sorted([profile, other], key=lambda p: p.id)
-
-            Match.objects.get_or_create(
-                profile1=profile1,
-                profile2=profile2,
-                course=course
-            )
+from .cards import card_queryset
+from .course_bitmaps import CourseFilter
+from .matching import shared_courses
+from .pagination import KeysetPaginator, cached_count
+from .query_budget import query_budget
+from .messaging import (
+    conversations_for, mark_read, message_payload, messages_after, messages_before, partner_read_up_to, save_message,
+    thread_group, thread_messages, unread_count
+)
+from .recommendations import Ranking
+from .search import search_profile_ids
+from . import featured, jobs, typeahead
 
 
 # ---------------------------------------
 # Main Views
 # ---------------------------------------
+@query_budget(queries=12)
 def index(request):
     """Homepage view"""
     try:
         featured_profiles = None
-        has_unread = False
 
         if request.user.is_authenticated:
-            featured_profiles = Profile.objects.exclude(user=request.user).order_by('?')[:3]
-            has_unread = Message.objects.filter(receiver=request.user, read=False).exists()
+            featured_profiles = featured.featured_profiles(request.user)
 
+        # The inbox badge comes from the unread_messages context processor
         return render(request, 'studybuddy_app/index.html', {
             'featured_profiles': featured_profiles,
-            'has_unread': has_unread
         })
 
     except Exception as e:
         messages.error(request, "An error occurred while loading the homepage.")
-        return render(request, 'studybuddy_app/index.html', {
-            'has_unread': False
-        })
+        return render(request, 'studybuddy_app/index.html')
 
 from django.contrib.auth.models import User
 from django.contrib.auth import login
@@ -66,6 +62,8 @@ from django.contrib import messages
 import re
 
 
+# Creating the account saves a User and a Profile, each with its own signal receivers
+@query_budget(queries=22)
 def signup(request):
     if request.user.is_authenticated:
         return redirect('studybuddy_app:index')
@@ -100,6 +98,7 @@ def signup(request):
 
 from django.contrib.auth.forms import AuthenticationForm
 
+@query_budget(queries=16)
 def user_login(request):
     if request.user.is_authenticated:
         return redirect('studybuddy_app:index')
@@ -123,6 +122,7 @@ def user_login(request):
     return render(request, 'studybuddy_app/login.html', {'form': form})
 
 
+@query_budget(queries=6)
 def user_logout(request):
     """User logout view"""
     if request.user.is_authenticated:
@@ -132,6 +132,7 @@ def user_logout(request):
     return redirect('studybuddy_app:index')
 
 
+@query_budget(queries=3)
 def more_about(request):
     """About page view"""
     return render(request, 'studybuddy_app/profile/more_about.html')
@@ -140,13 +141,13 @@ def more_about(request):
 # ---------------------------------------
 # Profile Views
 # ---------------------------------------
+@query_budget(queries=8)
 def profile(request, pk):
     """Display user profile"""
     try:
-        profile = get_object_or_404(Profile, pk=pk)
-        
+        # The template lists the courses several times; fetch them once
+        profile = get_object_or_404(Profile.objects.select_related('user').prefetch_related('courses'), pk=pk)
 
-        
         reviews = Review.objects.filter(reviewed_user=profile.user).select_related('reviewer')
         can_review = (
             request.user.is_authenticated and
@@ -164,31 +165,62 @@ def profile(request, pk):
         return redirect('studybuddy_app:index')
 
 
+# Keyset orderings per ?sort=; each ends in id so ties still page deterministically
+PROFILE_ORDERINGS = {
+    '': ('lname', 'fname', 'id'),
+    'rating': ('-rating', '-review_count', 'id'),
+}
+
+REVIEW_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'highest': ('-rating', '-created_at', '-id'),
+    'lowest': ('rating', '-created_at', '-id'),
+}
+
+
+def _page_query(request, *names):
+    """Query string of the given GET parameters, kept across page links"""
+    return urlencode({name: request.GET[name] for name in names if request.GET.get(name)})
+
+
 @login_required
+@query_budget(queries=7)
 def profile_list(request):
     """List all user profiles with pagination"""
     try:
-        profiles = Profile.objects.exclude(user=request.user).select_related('user')
-        paginator = Paginator(profiles, 10)  # Show 10 profiles per page
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        return render(request, 'studybuddy_app/profile/profile_list.html', {'page_obj': page_obj})
+        sort_by = request.GET.get('sort', '')
+        profiles = card_queryset(Profile.objects.exclude(user=request.user))
+        ordering = PROFILE_ORDERINGS.get(sort_by, PROFILE_ORDERINGS[''])
+        # Everyone but the viewer; the table count is cached rather than run per request
+        total = lambda: max(cached_count(Profile.objects.all(), 'profiles') - hasattr(request.user, 'profile'), 0)
+        paginator = KeysetPaginator(profiles, ordering, 10, total=total)  # Show 10 profiles per page
+        page_obj = paginator.page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            last='last' in request.GET,
+        )
+        return render(request, 'studybuddy_app/profile/profile_list.html', {
+            'page_obj': page_obj,
+            'page_query': _page_query(request, 'sort'),
+            'sort_by': sort_by,
+        })
     except Exception as e:
         messages.error(request, f"Error loading profiles: {e}")
         return render(request, 'studybuddy_app/profile/profile_list.html', {'page_obj': None})
 
 
 @login_required
-
+@query_budget(queries=15)
 def profile_add(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
 
     if request.method == "POST":
         form = ProfileAddForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            form.save()
-            form.save_m2m()
-            create_matches_for_profile(profile)
+            with jobs.batch():
+                form.save()
+                form.save_m2m()
             messages.success(request, "Profile saved successfully!")
             return redirect('studybuddy_app:profile', pk=profile.pk)
         else:
@@ -201,6 +233,7 @@ def profile_add(request):
 
 
 @login_required
+@query_budget(queries=3)
 def edit_my_profile(request):
     """Redirect to edit the current user's own profile"""
     try:
@@ -212,6 +245,7 @@ def edit_my_profile(request):
 
 
 @login_required
+@query_budget(queries=15)
 def profile_edit(request, pk):
     """Edit user profile"""
     profile = get_object_or_404(Profile, pk=pk)
@@ -225,11 +259,11 @@ def profile_edit(request, pk):
         form = ProfileEditForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
             try:
-                profile = form.save(commit=False)
-                profile.user = request.user
-                profile.save()
-                form.save_m2m()
-                create_matches_for_profile(profile)
+                with jobs.batch():
+                    profile = form.save(commit=False)
+                    profile.user = request.user
+                    profile.save()
+                    form.save_m2m()
                 messages.success(request, "Profile updated successfully!")
                 return redirect('studybuddy_app:profile', pk=profile.pk)
             except Exception as e:
@@ -243,9 +277,10 @@ def profile_edit(request, pk):
     return render(request, 'studybuddy_app/profile/profile_edit.html', {'form': form, 'profile': profile})
 
 
+@query_budget(queries=10)
 def user_profile(request, pk):
     """View another user's profile and send message"""
-    target_profile = get_object_or_404(Profile, pk=pk)
+    target_profile = get_object_or_404(Profile.objects.select_related('user').prefetch_related('courses'), pk=pk)
     message_sent = False
 
     if request.method == 'POST' and request.user.is_authenticated:
@@ -254,7 +289,7 @@ def user_profile(request, pk):
             message = form.save(commit=False)
             message.sender = request.user
             message.receiver = target_profile.user
-            message.save()
+            save_message(message)
             message_sent = True
             messages.success(request, "Message sent successfully!")
             form = MessageForm()  # Clear form after submission
@@ -270,20 +305,42 @@ def user_profile(request, pk):
     })
 
 
+def _buddies_page(request, profile, per_page=12):
+    """Paginated buddies for profile as (page_obj, {Profile: [shared courses]}).
+
+    Buddies are ranked by recommendations.py's score: shared courses, then
+    rating, major and study methods. ?all=, ?any= and ?none= narrow them
+    down by the courses they take. Both the ranking and the filter come
+    from in-memory indexes, so only the page's own profiles and courses are
+    read from the database.
+    """
+    course_filter = CourseFilter.from_query(request.GET)
+    ranking = Ranking(profile, course_filter.profile_ids() if course_filter else None)
+    page_obj = Paginator(ranking, per_page).get_page(request.GET.get('page'))
+    other_ids = [profile_id for profile_id, _score, _shared in page_obj]
+    profiles = card_queryset(courses=False).in_bulk(other_ids)
+    courses = shared_courses(profile.id, other_ids)
+    matched_profiles = {
+        profiles[other_id]: courses[other_id]
+        for other_id in other_ids
+        if other_id in profiles
+    }
+    return page_obj, matched_profiles
+
+
+# Includes the queries that build the buddy index and course bitmaps on a process's first request
 @login_required
+@query_budget(queries=10)
 def find_buddies(request):
     """Find study buddies based on matches"""
     try:
         profile = request.user.profile
-        matches = Match.objects.filter(Q(profile1=profile) | Q(profile2=profile))
-
-        matched_profiles = {}
-        for match in matches:
-            other = match.profile2 if match.profile1 == profile else match.profile1
-            matched_profiles.setdefault(other, []).append(match.course)
+        page_obj, matched_profiles = _buddies_page(request, profile)
 
         return render(request, 'studybuddy_app/profile/find_buddies.html', {
-            'matched_profiles': matched_profiles
+            'matched_profiles': matched_profiles,
+            'page_obj': page_obj,
+            'page_query': _page_query(request, 'all', 'any', 'none'),
         })
     except ObjectDoesNotExist:
         messages.error(request, "Please create a profile first to find study buddies.")
@@ -293,10 +350,39 @@ def find_buddies(request):
         return redirect('studybuddy_app:index')
 
 
+# Same as find_buddies
+@login_required
+@query_budget(queries=10)
+def find_buddies_json(request):
+    """Matched study buddies and their shared courses as paginated JSON"""
+    try:
+        profile = request.user.profile
+    except ObjectDoesNotExist:
+        return JsonResponse({'error': "Please create a profile first."}, status=400)
+
+    page_obj, matched_profiles = _buddies_page(request, profile)
+    return JsonResponse({
+        'results': [
+            {
+                'id': other.pk,
+                'user_id': other.user_id,
+                'username': other.user.username,
+                'name': other.full_name(),
+                'courses': [{'code': c.code, 'name': c.name} for c in courses],
+            }
+            for other, courses in matched_profiles.items()
+        ],
+        'page': page_obj.number,
+        'num_pages': page_obj.paginator.num_pages,
+        'total': page_obj.paginator.count,
+    })
+
+
 # ---------------------------------------
 # Messaging System
 # ---------------------------------------
 @login_required
+@query_budget(queries=8)
 def send_message(request, receiver_id):
     """Send a message to another user"""
     receiver = get_object_or_404(User, id=receiver_id)
@@ -310,11 +396,11 @@ def send_message(request, receiver_id):
         content = request.POST.get('content', '').strip()
         if content:
             try:
-                Message.objects.create(
+                save_message(Message(
                     sender=request.user,
                     receiver=receiver,
                     content=content
-                )
+                ))
                 messages.success(request, "Message sent successfully!")
                 return redirect('studybuddy_app:chat_thread', user_id=receiver.id)
             except Exception as e:
@@ -326,32 +412,35 @@ def send_message(request, receiver_id):
 
 
 @login_required
+@query_budget(queries=5)
 def inbox(request):
     """Display user's message inbox"""
     user = request.user
 
-    # Mark all unread messages as read
-    Message.objects.filter(receiver=user, read=False).update(read=True)
-
-    all_messages = Message.objects.filter(
-        Q(sender=user) | Q(receiver=user)
-    ).exclude(sender=user, receiver=user).order_by('-created_at')
-
-    threads = {}
-    for msg in all_messages:
-        other_user = msg.receiver if msg.sender == user else msg.sender
-        if other_user.id not in threads:
-            threads[other_user.id] = {
-                'user': other_user,
-                'last_message': msg
-            }
+    paginator = Paginator(conversations_for(user), 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    threads = [
+        {
+            'user': conversation.other(user),
+            'last_message': conversation.last_message,
+            'last_activity': conversation.last_activity,
+            'unread': conversation.unread_for(user),
+        }
+        for conversation in page_obj
+    ]
 
     return render(request, 'studybuddy_app/messages/inbox.html', {
-        'threads': threads.values()
+        'threads': threads,
+        'page_obj': page_obj,
     })
 
 
+def _message_json(message, user):
+    return {**message_payload(message), 'sent': message.sender_id == user.id}
+
+
 @login_required
+@query_budget(queries=10)
 def chat_thread(request, user_id):
     """Display chat thread with another user"""
     if user_id == request.user.id:
@@ -359,32 +448,117 @@ def chat_thread(request, user_id):
         return redirect('studybuddy_app:inbox')
 
     partner = get_object_or_404(User, id=user_id)
-
-    messages_received = Message.objects.filter(
-        Q(sender=request.user, receiver=partner) |
-        Q(sender=partner, receiver=request.user)
-    ).exclude(sender=request.user, receiver=request.user).order_by('created_at')
+    wants_json = request.headers.get('Accept', '').startswith('application/json')
 
     if request.method == 'POST':
         content = request.POST.get('content', '').strip()
         if content:
             try:
-                Message.objects.create(
+                message = save_message(Message(
                     sender=request.user,
                     receiver=partner,
                     content=content
-                )
+                ), client_id=request.POST.get('client_id'))
+                if wants_json:
+                    return JsonResponse({'message': _message_json(message, request.user)}, status=201)
                 return redirect('studybuddy_app:chat_thread', user_id=partner.id)
             except Exception as e:
                 messages.error(request, "Error sending message.")
+        if wants_json:
+            return JsonResponse({'error': "Message cannot be empty."}, status=400)
+
+    # Newest page only; older pages come from chat_history as the user scrolls up
+    messages_received, next_cursor = messages_before(thread_messages(request.user, partner))
+    mark_read(request.user, partner)
 
     return render(request, 'studybuddy_app/messages/chat_thread.html', {
         'messages_received': messages_received,
         'receiver': partner,
+        'next_cursor': next_cursor,
+        'partner_read': partner_read_up_to(request.user, partner),
     })
 
 
 @login_required
+@query_budget(queries=6)
+def chat_history(request, user_id):
+    """Older messages of a chat thread as JSON, one keyset page at a time"""
+    partner = get_object_or_404(User, id=user_id)
+    page, next_cursor = messages_before(
+        thread_messages(request.user, partner),
+        cursor=request.GET.get('before'),
+    )
+    return JsonResponse({
+        'messages': [_message_json(message, request.user) for message in page],
+        'next_cursor': next_cursor,
+    })
+
+
+# Longest a polling client may ask chat_since to hold the request open
+CHAT_POLL_MAX_WAIT = 25
+
+
+async def _wait_for_thread(user, partner, timeout):
+    """Sleep until a message is pushed to the thread's group, or timeout"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    group = thread_group(user.id, partner.id)
+    channel = await channel_layer.new_channel()
+    await channel_layer.group_add(group, channel)
+    try:
+        await asyncio.wait_for(channel_layer.receive(channel), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await channel_layer.group_discard(group, channel)
+
+
+# A held poll fetches twice (a position lookup plus one query per direction each time),
+# so each direction's query runs twice
+@query_budget(queries=13, repeats=4)
+async def chat_since(request, user_id):
+    """Messages in a chat thread newer than ?after=<id>, for polling clients.
+
+    With ?wait=<seconds> the request is held open (up to CHAT_POLL_MAX_WAIT)
+    until something arrives. Answers 304 when there is nothing new.
+    """
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    partner = await User.objects.filter(id=user_id).afirst()
+    if partner is None:
+        return JsonResponse({'error': "User not found."}, status=404)
+
+    try:
+        after = int(request.GET.get('after', 0))
+        wait = min(max(float(request.GET.get('wait', 0)), 0), CHAT_POLL_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({'error': "Invalid after or wait parameter."}, status=400)
+
+    fetch = sync_to_async(lambda: messages_after(thread_messages(user, partner), after))
+    new_messages = await fetch()
+    if not new_messages and wait:
+        await _wait_for_thread(user, partner, wait)
+        new_messages = await fetch()
+    if not new_messages:
+        return HttpResponseNotModified()
+
+    # The client shows what it fetched, so that much of the thread is now read
+    received = [message.id for message in new_messages if message.sender_id == partner.id]
+    if received:
+        await sync_to_async(mark_read)(user, partner, up_to=received[-1])
+
+    return JsonResponse({
+        'messages': [_message_json(message, user) for message in new_messages],
+        'last_id': new_messages[-1].id,
+        'unread': await sync_to_async(unread_count)(user, partner),
+        'partner_read': await sync_to_async(partner_read_up_to)(user, partner),
+    })
+
+
+@login_required
+@query_budget(queries=9)
 def reply_message(request, sender_id):
     """Reply to a specific message"""
     original_message = get_object_or_404(Message, id=sender_id)
@@ -396,7 +570,7 @@ def reply_message(request, sender_id):
             reply.sender = request.user
             reply.receiver = original_message.sender
             reply.replied_to = original_message
-            reply.save()
+            save_message(reply)
             messages.success(request, "Reply sent successfully!")
             return redirect('studybuddy_app:inbox')
         else:
@@ -414,6 +588,7 @@ def reply_message(request, sender_id):
 # Review System
 # ---------------------------------------
 @login_required
+@query_budget(queries=12)
 def leave_review(request, profile_id):
     """Leave a review for another user"""
     profile = get_object_or_404(Profile, id=profile_id)
@@ -451,6 +626,7 @@ def leave_review(request, profile_id):
     })
 
 
+@query_budget(queries=5)
 def reviews_list(request):
     """Display all reviews with filtering and pagination"""
     try:
@@ -466,39 +642,29 @@ def reviews_list(request):
             rating_value = int(rating_filter)
             reviews = reviews.filter(rating__gte=rating_value)
         
-        # Apply sorting
-        if sort_by == 'newest':
-            reviews = reviews.order_by('-created_at')
-        elif sort_by == 'oldest':
-            reviews = reviews.order_by('created_at')
-        elif sort_by == 'highest':
-            reviews = reviews.order_by('-rating', '-created_at')
-        elif sort_by == 'lowest':
-            reviews = reviews.order_by('rating', '-created_at')
+        # Site-wide statistics, maintained incrementally (see reviews.py)
+        stats = ReviewStats.load()
+        total_reviews = stats.total_reviews
+        average_rating = stats.average_rating
+        five_star_reviews = stats.five_star_count
+        active_reviewers = stats.active_reviewers
+
+        # Keyset pagination on the active sort; the stats row already knows the unfiltered total
+        ordering = REVIEW_ORDERINGS.get(sort_by, REVIEW_ORDERINGS['newest'])
+        if rating_filter and rating_filter.isdigit():
+            total = lambda: cached_count(reviews, f'reviews:rating_gte:{rating_value}')
         else:
-            reviews = reviews.order_by('-created_at')
-        
-        # Calculate statistics
-        stats = Review.objects.aggregate(
-            total_reviews=Count('id'),
-            average_rating=Avg('rating'),
-            five_star_count=Count('id', filter=Q(rating=5)),
-            active_reviewers=Count('reviewer', distinct=True)
+            total = lambda: total_reviews
+        paginator = KeysetPaginator(reviews, ordering, 12, total=total)  # Show 12 reviews per page
+        page_obj = paginator.page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            last='last' in request.GET,
         )
         
-        # Handle None values
-        total_reviews = stats['total_reviews'] or 0
-        average_rating = stats['average_rating'] or 0
-        five_star_reviews = stats['five_star_count'] or 0
-        active_reviewers = stats['active_reviewers'] or 0
-        
-        # Pagination
-        paginator = Paginator(reviews, 12)  # Show 12 reviews per page
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        
         return render(request, 'studybuddy_app/reviews_list.html', {
             'page_obj': page_obj,
+            'page_query': _page_query(request, 'rating', 'sort'),
             'total_reviews': total_reviews,
             'average_rating': average_rating,
             'five_star_reviews': five_star_reviews,
@@ -520,28 +686,47 @@ def reviews_list(request):
 # ---------------------------------------
 # Search Functionality
 # ---------------------------------------
+@query_budget(queries=3)
+def search_suggest(request):
+    """Typeahead suggestions for the search box, served from memory"""
+    query = request.GET.get('q', '')
+    return JsonResponse({'suggestions': typeahead.suggest(query[:50])})
+
+
+@query_budget(queries=9)
 def search_buddies(request):
-    """Search for study buddies based on various criteria"""
+    """Search for study buddies, ranked by full-text relevance"""
     query = request.GET.get('q', '').strip()
     
+    course_filter = CourseFilter.from_query(request.GET)
+
     try:
-        if query:
-            results = Profile.objects.filter(
-                Q(courses__name__icontains=query) |
-                Q(study_methods__icontains=query) |
-                Q(bio__icontains=query) |
-                Q(user__username__icontains=query)
-            ).exclude(user=request.user if request.user.is_authenticated else None).distinct()
-            
-            paginator = Paginator(results, 10)  # Show 10 results per page
+        if query or course_filter:
+            if query:
+                profile_ids = search_profile_ids(query)
+                if course_filter:
+                    allowed = course_filter.profile_ids()
+                    profile_ids = [profile_id for profile_id in profile_ids if profile_id in allowed]
+            else:
+                profile_ids = sorted(course_filter.profile_ids())
+            if request.user.is_authenticated:
+                own = Profile.objects.filter(user=request.user).values_list('id', flat=True).first()
+                profile_ids = [profile_id for profile_id in profile_ids if profile_id != own]
+
+            paginator = Paginator(profile_ids, 10)  # Show 10 results per page
             page_number = request.GET.get('page')
             page_obj = paginator.get_page(page_number)
+
+            # Load only this page's profiles, in rank order
+            profiles = card_queryset().in_bulk(page_obj.object_list)
+            page_obj.object_list = [profiles[pk] for pk in page_obj.object_list if pk in profiles]
         else:
             page_obj = None
             messages.info(request, "Please enter a search term.")
         
         return render(request, 'studybuddy_app/search_results.html', {
             'page_obj': page_obj,
+            'page_query': _page_query(request, 'q', 'all', 'any', 'none'),
             'query': query
         })
     except Exception as e:
@@ -3,6 +3,7 @@ Django settings for studybuddy_project project.
 """
 import os
 import dj_database_url
+from urllib.parse import urlparse
 from pathlib import Path
 
 # Build paths
@@ -26,6 +27,7 @@ CSRF_TRUSTED_ORIGINS = [
 
 # Application definition
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver, needed for WebSocket chat in development
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -33,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'channels',
 
     "crispy_forms",
     "crispy_bootstrap5",
@@ -46,7 +49,8 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'studybuddy_app.middleware.AsyncWhiteNoiseMiddleware',
+    'studybuddy_app.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,12 +73,22 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'studybuddy_app.context_processors.unread_messages',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'studybuddy_project.wsgi.application'
+ASGI_APPLICATION = 'studybuddy_project.asgi.application'
+
+# Channel layer for WebSocket chat - in-process, so no external service is needed.
+# It only reaches sockets held by the same process, so run a single ASGI worker.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
 
 # Database - supports PostgreSQL via environment variable, falls back to SQLite
 DATABASES = {
@@ -84,6 +98,46 @@ DATABASES = {
     )
 }
 
+# Cache - local memory per process by default. CACHE_URL picks another tier:
+# file:///var/tmp/studybuddy-cache shares it between workers on one host,
+# redis://host:6379/0 (or any Redis-protocol server) shares it everywhere
+# and needs the redis package installed.
+CACHE_URL = urlparse(os.getenv('CACHE_URL', 'locmem://'))
+if CACHE_URL.scheme == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_URL.path,
+        }
+    }
+elif CACHE_URL.scheme in ('redis', 'rediss'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL.geturl(),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'studybuddy',
+        }
+    }
+
+# Background jobs (studybuddy_app/jobs.py) are run by `manage.py run_worker`, in
+# production as its own service (Procfile, railway.worker.json). JOB_QUEUE_EAGER
+# runs them inline instead; the default in development, where there is no worker
+JOB_QUEUE_EAGER = os.getenv('JOB_QUEUE_EAGER', str(DEBUG)) == 'True'
+
+# Per-request query budgets (studybuddy_app/query_budget.py). With QUERY_BUDGETS
+# on, a request over its view's @query_budget, or running one SQL shape more than
+# QUERY_BUDGET_MAX_REPEATS times, is logged - or raises, with QUERY_BUDGET_RAISE
+QUERY_BUDGETS = os.getenv('QUERY_BUDGETS', str(DEBUG)) == 'True'
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', 'False') == 'True'
+QUERY_BUDGET_MAX_REPEATS = int(os.getenv('QUERY_BUDGET_MAX_REPEATS', '3'))
+QUERY_BUDGET_DEFAULT = None
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "studybuddy_project.settings")
 
 application = get_wsgi_application()
+
+# Build the in-memory typeahead index before the first request arrives
+from studybuddy_app import typeahead  # noqa: E402
+
+typeahead.warm()